@@ -2,6 +2,7 @@
 
 import os
 import sys
+import math
 import time
 import json
 import select
@@ -12,6 +13,7 @@ import argparse
 from wpan import *
 from dwarf import *
 from mqrpc import *
+from rfmsg import *
 from config import *
 
 import paho.mqtt.client as mqtt
@@ -25,6 +27,7 @@ UUID = None
 WPAN = None
 MQTT = None
 MRPC = None
+BTCH = None
 
 TAGS = {}
 
@@ -41,7 +44,7 @@ def rpc_unregister_tag(EUI64):
     TAGS.pop(EUI64, None)
 
 def rpc_get_dtattr(ATTR, FORMAT):
-    return WPAN.get_dtattr(ATTR,FORMAT)
+    return WPAN.get_dtattr_format(ATTR,FORMAT)
 
 def rpc_get_dwstat(ATTR):
     return WPAN.get_dwstats(ATTR)
@@ -81,9 +84,86 @@ def wpan_xmit_beacon(BREF, SUB=0, FLAGS=0):
     WPAN.send(frame)
 
 
+class RFBatch():
+
+    def __init__(self, binary, frames, window):
+        self.binary = binary
+        self.frames = frames
+        self.window = window
+        self.msgs   = []
+        self.first  = None
+        self.stats  = {
+            'batches':      0,
+            'frames':       0,
+            'size_max':     0,
+            'size_avg':     0.0,
+            'latency_max':  0.0,
+            'latency_avg':  0.0,
+        }
+
+    def add(self, msg):
+        if not self.msgs:
+            self.first = time.monotonic()
+        self.msgs.append(msg)
+        if len(self.msgs) >= self.frames:
+            self.flush()
+
+    def remaining(self):
+        if self.msgs:
+            return max(self.first + self.window - time.monotonic(), 0.0)
+        return None
+
+    def poll(self):
+        if self.msgs and self.remaining() == 0.0:
+            self.flush()
+
+    def flush(self):
+        if self.msgs:
+            size = len(self.msgs)
+            if self.binary:
+                data = encode_rf_batch(self.msgs)
+            else:
+                data = json.dumps(self.msgs).encode()
+            MQTT.publish(f'TAIL/RF/{DUID}/{UUID}', data)
+            latency = time.monotonic() - self.first
+            self.msgs = []
+            self.first = None
+            self.update_stats(size,latency)
+
+    def update_stats(self, size, latency):
+        stats = self.stats
+        stats['batches'] += 1
+        stats['frames'] += size
+        stats['size_max'] = max(stats['size_max'], size)
+        stats['size_avg'] = stats['frames'] / stats['batches']
+        stats['latency_max'] = max(stats['latency_max'], latency)
+        stats['latency_avg'] += (latency - stats['latency_avg']) / stats['batches']
+        log.debug(f'RFBatch::flush: {size} frames in {latency*1000:.3f}ms')
+
+
+def rpc_get_rfstats():
+    if BTCH:
+        return dict(BTCH.stats)
+    return {}
+
+
 def send_mqtt_rf_msg(**kwargs):
-    data = json.dumps(kwargs).encode()
-    MQTT.publish(f'TAIL/RF/{DUID}/{UUID}', data)
+    if config.anchor.rf_format == 'binary':
+        data = encode_rf_msg(**kwargs)
+    else:
+        data = kwargs
+    if BTCH:
+        BTCH.add(data)
+    else:
+        if not isinstance(data,bytes):
+            data = json.dumps(data).encode()
+        MQTT.publish(f'TAIL/RF/{DUID}/{UUID}', data)
+
+def send_mqtt_rf_frame(dir, frame):
+    if config.anchor.rf_format == 'binary':
+        send_mqtt_rf_msg(ANCHOR=UUID, DIR=dir, TIMES=frame_times(frame), FRAME=frame.frame, FINFO=frame.timestamp.bytes())
+    else:
+        send_mqtt_rf_msg(ANCHOR=UUID, DIR=dir, TIMES=frame_times(frame), FRAME=frame.hex(), FINFO=frame.timestamp.hex())
 
 
 def frame_times(frame):
@@ -104,7 +184,7 @@ def recv_wpan_rx():
     frame = WPAN.recvrx()
     log.debug(f'recv_wpan_rx: {frame}')
     if frame.tail_protocol == frame.TAIL_PROTO_STD:
-        send_mqtt_rf_msg(ANCHOR=UUID, DIR='RX', TIMES=frame_times(frame), FRAME=frame.hex(), FINFO=frame.timestamp.hex())
+        # Respond with a beacon before reporting, so it never waits for the RF batch
         if frame.tail_frmtype == frame.FRAME_TAG_BLINK:
             src = frame.get_src_eui()
             if src in TAGS:
@@ -112,12 +192,13 @@ def recv_wpan_rx():
                 seq = frame.frame_seqnum
                 ref = make_ranging_ref(tag,seq)
                 wpan_xmit_beacon(ref)
+        send_mqtt_rf_frame('RX', frame)
 
 def recv_wpan_tx():
     frame = WPAN.recvtx()
     log.debug(f'recv_wpan_tx: {frame}')
     if frame.tail_protocol == frame.TAIL_PROTO_STD:
-        send_mqtt_rf_msg(ANCHOR=UUID, DIR='TX', TIMES=frame_times(frame), FRAME=frame.hex(), FINFO=frame.timestamp.hex())
+        send_mqtt_rf_frame('TX', frame)
 
 
 def socket_loop():
@@ -128,7 +209,12 @@ def socket_loop():
     wait.register(WPAN.if_sock, select.POLLIN)
 
     while True:
-        for (fd,flags) in wait.poll(100):
+        timeout = 100
+        if BTCH:
+            remaining = BTCH.remaining()
+            if remaining is not None:
+                timeout = math.ceil(remaining * 1000)
+        for (fd,flags) in wait.poll(timeout):
             try:
                 if flags & select.POLLIN:
                     recv_wpan_rx()
@@ -141,14 +227,19 @@ def socket_loop():
                 
             except Exception:
                 log.exception('socket_loop error')
+        if BTCH:
+            BTCH.poll()
     
+    if BTCH:
+        BTCH.flush()
+
     WPAN.close()
 
 
     
 def main():
 
-    global UUID, DUID, MQTT, WPAN, MRPC
+    global UUID, DUID, MQTT, WPAN, MRPC, BTCH
     
     parser = argparse.ArgumentParser(description="Tail Anchor Daemon")
 
@@ -172,6 +263,9 @@ def main():
     MQTT.loop_start()
 
     MRPC = MQRPC(MQTT,UUID)
+
+    if config.anchor.batch_frames > 1:
+        BTCH = RFBatch(config.anchor.rf_format == 'binary', config.anchor.batch_frames, config.anchor.batch_window)
     
     MRPC.register('GETDWSTAT', rpc_get_dwstat)
     MRPC.register('GETDWSTATS', rpc_get_dwstats)
@@ -179,6 +273,7 @@ def main():
     MRPC.register('GETDWATTR', rpc_get_dwattr)
     MRPC.register('SETDWATTR', rpc_set_dwattr)
     MRPC.register('GETDWCONFIG', rpc_get_dwconfig)
+    MRPC.register('GETRFSTATS', rpc_get_rfstats)
     
     MRPC.register('RESET', rpc_reset_tags)
     MRPC.register('REGISTER', rpc_register_tag)
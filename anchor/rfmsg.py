@@ -0,0 +1 @@
+../python/rfmsg.py
\ No newline at end of file
@@ -4,13 +4,54 @@ import sys
 import time
 import json
 import uuid
+import heapq
+import bisect
 import logger
+import functools
 import threading
+import concurrent.futures
 
 
 log = logger.getLogger(__name__)
 
 
+# Call latency histogram bins (s)
+_LATENCY_BINS = ( 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0 )
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RPCStats():
+
+    def __init__(self):
+        self.calls    = 0
+        self.replies  = 0
+        self.timeouts = 0
+        self.errors   = 0
+        self.lat_sum  = 0.0
+        self.lat_max  = 0.0
+        self.latency  = [ 0 ] * (len(_LATENCY_BINS) + 1)
+
+    def record(self, latency):
+        self.replies += 1
+        self.lat_sum += latency
+        self.lat_max = max(self.lat_max, latency)
+        self.latency[bisect.bisect_left(_LATENCY_BINS, latency)] += 1
+
+    def get_stats(self):
+        return {
+            'calls':    self.calls,
+            'replies':  self.replies,
+            'timeouts': self.timeouts,
+            'errors':   self.errors,
+            'lat_avg':  self.lat_sum / max(self.replies, 1),
+            'lat_max':  self.lat_max,
+            'latency':  dict(zip([ f'<{b*1e3:g}ms' for b in _LATENCY_BINS ] + [ f'>{_LATENCY_BINS[-1]*1e3:g}ms' ], self.latency)),
+        }
+
+
 class MQRPC:
 
     def __init__(self, mqtt=None, rpcid=None, timeout=1.0):
@@ -21,6 +62,11 @@ class MQRPC:
         self.prefix   = 'TAIL/RPC'
         self.pending  = {}
         self.handler  = {}
+        self.lock     = threading.Condition()
+        self.deadline = []
+        self.reaper   = None
+        self.running  = True
+        self.stats    = {}
         
         self.register('PING', MQRPC.rpc_ping)
         
@@ -32,6 +78,18 @@ class MQRPC:
 
 
     def close(self):
+        # Calls still waiting for a reply would otherwise block forever
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.deadline.clear()
+            for (future,stats,sent) in pending:
+                stats.errors += 1
+        for (future,stats,sent) in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError('MQRPC closed'))
         self.mqtt.unsubscribe(f'{self.prefix}/{self.rpcid}')
         self.mqtt.unsubscribe(f'{self.prefix}/BROADCAST')
         self.mqtt.message_callback_remove(f'{self.prefix}/{self.rpcid}')
@@ -56,17 +114,34 @@ class MQRPC:
         log.debug(f'recvrpc: {SRC} {DST} {VER} {UID} {FUNC} {ARGS}')
         if VER == self.version:
             if FUNC == '__RETURN__':
-                if UID in self.pending:
-                    self.pending[UID]['args'] = ARGS
-                    self.pending[UID]['wait'].set()
+                self.complete(UID, ARGS, None)
+            elif FUNC == '__ERROR__':
+                self.complete(UID, None, RemoteError(ARGS))
             elif FUNC in self.handler:
-                RETN = self.handler[FUNC](**ARGS)
-                if UID:
+                try:
+                    RETN = self.handler[FUNC](**ARGS)
+                except Exception as err:
+                    # Let the caller fail now rather than time out
+                    if UID:
+                        self.sendrpc(SRC=self.rpcid, DST=SRC, UID=UID, FUNC='__ERROR__', ARGS=repr(err))
+                    raise
+                # A handler may return a future to reply once it completes
+                if isinstance(RETN, concurrent.futures.Future):
+                    if UID:
+                        RETN.add_done_callback(functools.partial(self.reply, SRC, UID))
+                elif UID:
                     self.sendrpc(SRC=self.rpcid, DST=SRC, UID=UID, FUNC='__RETURN__', ARGS=RETN)
         else:
             raise SyntaxWarning(f'version mismatch {VER} <> {self.version}')
 
 
+    def reply(self, dst, uid, future):
+        if future.exception() is None:
+            self.sendrpc(SRC=self.rpcid, DST=dst, UID=uid, FUNC='__RETURN__', ARGS=future.result())
+        else:
+            self.sendrpc(SRC=self.rpcid, DST=dst, UID=uid, FUNC='__ERROR__', ARGS=repr(future.exception()))
+
+
     def register(self,name,func):
         log.debug(f'register {name} = {func}')
         self.handler[name] = func
@@ -76,27 +151,106 @@ class MQRPC:
         self.handler.pop(name,None)
 
 
-    def init_call(self):
+    def init_call(self, remote, func, expiry=None):
         uid = str(uuid.uuid4())
-        self.pending[uid] = { 'args':None, 'wait':threading.Event() }
-        return uid
-
-    def wait_call(self,uid):
-        wait = self.pending[uid]['wait'].wait(self.timeout)
-        args = self.pending[uid]['args']
-        self.pending.pop(uid)
-        if not wait:
-            raise TimeoutError
-        return args
+        future = concurrent.futures.Future()
+        sent = time.monotonic()
+        if expiry is None:
+            expiry = sent + self.timeout
+        with self.lock:
+            stats = self.stats.setdefault((remote,func), RPCStats())
+            stats.calls += 1
+            if not self.running:
+                stats.errors += 1
+                future.set_exception(ConnectionError('MQRPC closed'))
+                return (None,future)
+            self.pending[uid] = (future,stats,sent)
+            heapq.heappush(self.deadline, (expiry,uid))
+            if self.reaper is None:
+                self.reaper = threading.Thread(target=self.reap, name='mqrpc-reaper', daemon=True)
+                self.reaper.start()
+            elif self.deadline[0][1] == uid:
+                self.lock.notify_all()
+        return (uid,future)
+
+    def reap(self):
+        # One thread times out all pending calls, completed ones are skipped lazily
+        with self.lock:
+            while self.running:
+                now = time.monotonic()
+                expired = []
+                while self.deadline and self.deadline[0][0] <= now:
+                    (expiry,uid) = heapq.heappop(self.deadline)
+                    call = self.pending.pop(uid, None)
+                    if call is not None:
+                        call[1].timeouts += 1
+                        expired.append(call[0])
+                if expired:
+                    self.lock.release()
+                    try:
+                        for future in expired:
+                            if future.set_running_or_notify_cancel():
+                                future.set_exception(TimeoutError())
+                    finally:
+                        self.lock.acquire()
+                elif self.deadline:
+                    self.lock.wait(self.deadline[0][0] - now)
+                else:
+                    self.lock.wait()
+
+    def complete(self, uid, args, error):
+        with self.lock:
+            call = self.pending.pop(uid, None)
+            if call is None:
+                return
+            (future,stats,sent) = call
+            if error is None:
+                stats.record(time.monotonic() - sent)
+            else:
+                stats.errors += 1
+        if future.set_running_or_notify_cancel():
+            if error is None:
+                future.set_result(args)
+            else:
+                future.set_exception(error)
+
+    def call_async(self,remote,func,**kwargs):
+        log.debug(f'call_async {remote} {func} {kwargs}')
+        (uid,future) = self.init_call(remote,func)
+        if uid is not None:
+            self.sendrpc(SRC=self.rpcid, DST=remote, UID=uid, FUNC=func, ARGS=kwargs)
+        return future
 
     def call(self,remote,func,**kwargs):
         log.debug(f'call {remote} {func} {kwargs}')
-        uid = self.init_call()
-        self.sendrpc(SRC=self.rpcid, DST=remote, UID=uid, FUNC=func, ARGS=kwargs)
-        args = self.wait_call(uid)
+        args = self.call_async(remote,func,**kwargs).result()
         log.debug(f'call {remote} {func} : {args}')
         return args
 
+    def multicall_async(self,remotes,func,**kwargs):
+        log.debug(f'multicall {remotes} {func} {kwargs}')
+        expiry = time.monotonic() + self.timeout
+        calls = {}
+        for remote in remotes:
+            (uid,future) = self.init_call(remote,func,expiry)
+            calls[remote] = future
+            if uid is not None:
+                self.sendrpc(SRC=self.rpcid, DST=remote, UID=uid, FUNC=func, ARGS=kwargs)
+        return calls
+
+    def multicall(self,remotes,func,**kwargs):
+        # All calls share one deadline; returns the results and the errors by remote
+        calls = self.multicall_async(remotes,func,**kwargs)
+        concurrent.futures.wait(calls.values())
+        results = {}
+        errors = {}
+        for (remote,future) in calls.items():
+            if future.exception() is not None:
+                errors[remote] = future.exception()
+            else:
+                results[remote] = future.result()
+        return (results,errors)
+
     def post(self,remote,func,**kwargs):
         self.sendrpc(SRC=self.rpcid, DST=remote, UID=None, FUNC=func, ARGS=kwargs)
 
@@ -104,6 +258,27 @@ class MQRPC:
         self.sendrpc(SRC=self.rpcid, DST='BROADCAST', UID=None, FUNC=func, ARGS=kwargs)
 
 
+    def get_stats(self, remote=None, func=None):
+        stats = {}
+        with self.lock:
+            for ((rem,fun),entry) in self.stats.items():
+                if remote in (None,rem) and func in (None,fun):
+                    stats.setdefault(rem, {})[fun] = entry.get_stats()
+        return stats
+
+    def dump_stats(self):
+        for (remote,funcs) in self.get_stats().items():
+            for (func,entry) in funcs.items():
+                log.info(f'RPC {remote} {func}: calls {entry["calls"]} replies {entry["replies"]} '
+                         f'timeouts {entry["timeouts"]} errors {entry["errors"]} '
+                         f'avg {entry["lat_avg"]*1e3:.1f}ms max {entry["lat_max"]*1e3:.1f}ms')
+
+    def rpc_get_rpc_stats(self, REMOTE=None, FUNC=None, DUMP=False):
+        if DUMP:
+            self.dump_stats()
+        return self.get_stats(REMOTE, FUNC)
+
+
     def rpc_ping(**kwargs):
         log.debug(f'RPC PING: {kwargs}')
         return kwargs
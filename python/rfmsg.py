@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+#
+# rfmsg.py	Tail RF message encoding between anchors and server
+#
+
+import json
+import struct
+
+from wpan import *
+
+
+##
+## Binary RF message format (v1)
+##
+##  magic     u8      RFMSG_MAGIC (JSON messages always start with '{')
+##  version   u8      RFMSG_VERSION
+##  anchor    8s      Anchor EUI-64
+##  dir       u8      0:RX 1:TX
+##  sw        u64     Software timestamp [ns]
+##  hw        u64     Hardware timestamp [ns]
+##  hi_nsec   u64     Hires timestamp [ns]
+##  hi_frac   u32     Hires timestamp fraction [2^-32 ns]
+##  frm_len   u16     Length of the raw WPAN frame
+##  ts_len    u16     Length of the raw Timestamp structure
+##  frame     bytes   Raw WPAN frame
+##  tstamp    bytes   Raw Timestamp structure
+##
+
+RFMSG_MAGIC   = 0xa5
+RFMSG_VERSION = 1
+
+RFMSG_HEADER  = struct.Struct('<BB8sBQQQIHH')
+
+
+##
+## Binary RF batch format (v1)
+##
+##  magic     u8      RFMSG_BATCH_MAGIC
+##  version   u8      RFMSG_VERSION
+##  count     u16     Number of RF messages
+##  msgs      bytes   Binary RF messages, back to back
+##
+## JSON batches are plain JSON lists of RF messages.
+##
+
+RFMSG_BATCH_MAGIC  = 0xa6
+
+RFMSG_BATCH_HEADER = struct.Struct('<BBH')
+
+RFMSG_DIRS    = ( 'RX', 'TX' )
+RFMSG_DIR_IDS = { 'RX':0, 'TX':1 }
+
+
+def is_binary_rf_msg(data):
+    return len(data) > 0 and data[0] == RFMSG_MAGIC
+
+def is_binary_rf_batch(data):
+    return len(data) > 0 and data[0] == RFMSG_BATCH_MAGIC
+
+
+def encode_rf_msg(ANCHOR, DIR, TIMES, FRAME, FINFO):
+    hi_nsec = TIMES['hi'] >> 32
+    hi_frac = TIMES['hi'] & 0xffffffff
+    head = RFMSG_HEADER.pack(RFMSG_MAGIC, RFMSG_VERSION, bytes.fromhex(ANCHOR), RFMSG_DIR_IDS[DIR],
+                             TIMES['sw'], TIMES['hw'], hi_nsec, hi_frac, len(FRAME), len(FINFO))
+    return head + FRAME + FINFO
+
+
+def encode_rf_batch(msgs):
+    head = RFMSG_BATCH_HEADER.pack(RFMSG_BATCH_MAGIC, RFMSG_VERSION, len(msgs))
+    return head + b''.join(msgs)
+
+
+def decode_binary_rf_msg(data, offset=0):
+    (magic,vers,anchor,dir,sw,hw,hi_nsec,hi_frac,frm_len,ts_len) = RFMSG_HEADER.unpack_from(data,offset)
+    if magic != RFMSG_MAGIC:
+        raise ValueError(f'Invalid RF message magic 0x{magic:02x}')
+    if vers != RFMSG_VERSION:
+        raise ValueError(f'Unsupported RF message version {vers}')
+    ptr = offset + RFMSG_HEADER.size
+    frame = bytes(data[ptr:ptr+frm_len])
+    ptr += frm_len
+    if ts_len >= sizeof(Timestamp):
+        finfo = Timestamp.from_buffer_copy(data, ptr)
+    else:
+        finfo = Timestamp.from_buffer_copy(bytes(data[ptr:ptr+ts_len]).ljust(sizeof(Timestamp), b'\0'))
+    ptr += ts_len
+    times = { 'sw':sw, 'hw':hw, 'hi':(hi_nsec << 32) | hi_frac }
+    args = { 'ANCHOR':anchor.hex(), 'DIR':RFMSG_DIRS[dir], 'TIMES':times, 'FRAME':frame, 'FINFO':finfo }
+    return (args,ptr)
+
+
+def decode_json_rf_msg(data):
+    return json.loads(data.decode())
+
+
+def decode_rf_msg(data):
+    if is_binary_rf_msg(data):
+        (args,_) = decode_binary_rf_msg(data)
+        return args
+    return decode_json_rf_msg(data)
+
+
+def decode_binary_rf_batch(data):
+    (magic,vers,count) = RFMSG_BATCH_HEADER.unpack_from(data,0)
+    if vers != RFMSG_VERSION:
+        raise ValueError(f'Unsupported RF batch version {vers}')
+    ptr = RFMSG_BATCH_HEADER.size
+    msgs = []
+    for i in range(count):
+        (args,ptr) = decode_binary_rf_msg(data,ptr)
+        msgs.append(args)
+    return msgs
+
+
+def decode_rf_msgs(data):
+    if is_binary_rf_msg(data):
+        (args,_) = decode_binary_rf_msg(data)
+        return [ args ]
+    if is_binary_rf_batch(data):
+        return decode_binary_rf_batch(data)
+    msgs = decode_json_rf_msg(data)
+    if isinstance(msgs,list):
+        return msgs
+    return [ msgs ]
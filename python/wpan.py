@@ -318,7 +318,7 @@ class WPANInterface:
         return None
 
     def get_dtattr_format(self, attr, form):
-        if os.path.isfile(self.DW1000_SYSDT + attr):
+        if os.path.isfile(self.DW1000_SYSFS_DT + attr):
             with open(self.DW1000_SYSFS_DT + attr, 'rb') as f:
                 data = f.read()
                 return struct.unpack(form, data)
@@ -529,6 +529,8 @@ class WPANFrame:
             self.decode_rawts(bytes.fromhex(data))
         elif type(data) is list:
             self.decode_ancl_list(data)
+        elif isinstance(data,Timestamp):
+            self.timestamp = data
         else:
             raise TypeError(f'Invalid Timestamp type {type(data)}')
     
@@ -737,17 +739,36 @@ class TailWPANFrame(WPANFrame):
         0x40 : lambda x: round(x*5/32768, 3),
     }
 
-    def __init__(self, data=None, ancl=None, iface=None):
+    def __init__(self, data=None, ancl=None, iface=None, lazy=False):
         WPANFrame.__init__(self,iface=iface)
         self.tail_protocol  = self.TAIL_PROTO_NONE
         self.tail_payload   = None
+        self.tail_frmtype   = None
+        self.tail_subtype   = None
+        self.tail_lazy      = None
+        if not lazy:
+            self.reset_tail()
+        if data is not None:
+            self.decode(data,lazy)
+        if ancl is not None:
+            self.decode_ancl(ancl)
+
+    def __getattr__(self, name):
+        # Lazy frames decode the Tail payload on first access to any of its fields
+        lazy = self.__dict__.get('tail_lazy')
+        if lazy is not None and name.startswith('tail_'):
+            self.tail_lazy = None
+            self.reset_tail()
+            self.decode_tail(self.frame,lazy)
+            return getattr(self,name)
+        raise AttributeError(f'{type(self).__name__} object has no attribute {name}')
+
+    def reset_tail(self):
         self.tail_listen    = False
         self.tail_accel     = False
         self.tail_dcin      = False
         self.tail_salt      = False
         self.tail_timing    = False
-        self.tail_frmtype   = None
-        self.tail_subtype   = None
         self.tail_txtime    = None
         self.tail_rxtime    = None
         self.tail_rxtimes   = None
@@ -761,11 +782,6 @@ class TailWPANFrame(WPANFrame):
         self.tail_ies       = None
         self.tail_eies      = None
         self.tail_config    = None
-        
-        if data is not None:
-            self.decode(data)
-        if ancl is not None:
-            self.decode_ancl(ancl)
 
 
     def get_beacon_ref(self):
@@ -783,7 +799,7 @@ class TailWPANFrame(WPANFrame):
         data = struct.pack('<Q',times)[0:5]
         return data
 
-    def decode(self,data):
+    def decode(self,data,lazy=False):
         if type(data) is str:
             data = bytes.fromhex(data)
         elif type(data) is not bytes:
@@ -798,220 +814,228 @@ class TailWPANFrame(WPANFrame):
             ptr += 1
             self.tail_frmtype = _getbits(frame,4,4)
             self.tail_subtype = _getbits(frame,0,4)
-            if self.tail_frmtype == self.FRAME_TAG_BLINK:
-                self.tail_eies_present   = _testbit(frame,1)
-                self.tail_ies_present    = _testbit(frame,2)
-                self.tail_cookie_present = _testbit(frame,3)
-                (flags,) = struct.unpack_from('<B',data,ptr)
-                ptr += 1
-                self.tail_flags  = flags
-                self.tail_listen = _testbit(flags,7)
-                self.tail_accel  = _testbit(flags,6)
-                self.tail_dcin   = _testbit(flags,5)
-                self.tail_salt   = _testbit(flags,4)
-                if self.tail_cookie_present:
-                    (cookie,) = struct.unpack_from('16s',data,ptr)
-                    ptr += 16
-                    self.tail_cookie = cookie
-                if self.tail_ies_present:
-                    (iec,) = struct.unpack_from('<B',data,ptr)
-                    ptr += 1
-                    self.tail_ies = {}
-                    for i in range(iec):
-                        (id,) = struct.unpack_from('<B',data,ptr)
-                        ptr += 1
-                        idf = _getbits(id,6,2)
-                        if idf == 0:
-                            (val,) = struct.unpack_from('<B',data,ptr)
-                            ptr += 1
-                        elif idf == 1:
-                            (val,) = struct.unpack_from('<H',data,ptr)
-                            ptr += 2
-                        elif idf == 2:
-                            (val,) = struct.unpack_from('<I',data,ptr)
-                            ptr += 4
-                        else:
-                            (val,) = struct.unpack_from('<p',data,ptr)
-                            ptr += len(val) + 1
-                        if id in TailWPANFrame.IE_CONV:
-                            val = TailWPANFrame.IE_CONV[id](val)
-                        if id in TailWPANFrame.IE_KEYS:
-                            self.tail_ies[TailWPANFrame.IE_KEYS[id]] = val
-                        else:
-                            self.tail_ies['IE{:02X}'.format(id)] = val
-                if self.tail_eies_present:
-                    raise NotImplementedError('decode tail EIEs')
-            elif self.tail_frmtype == self.FRAME_ANCHOR_BEACON:
-                (flags,) = struct.unpack_from('<B',data,ptr)
+            if lazy:
+                self.tail_lazy = ptr
+            else:
+                self.decode_tail(data,ptr)
+    ## Tail encrypted protocol
+        elif magic == TailWPANFrame.TAIL_MAGIC_ENC:
+            self.tail_protocol = self.TAIL_PROTO_ENC
+            self.tail_payload = data[ptr:]
+    ## Tail protocols end
+        else:
+            self.tail_protocol = self.TAIL_PROTO_NONE
+            self.tail_payload = data[ptr-1:]
+        if lazy and self.tail_lazy is None:
+            self.reset_tail()
+
+    def decode_tail(self,data,ptr):
+        if self.tail_frmtype == self.FRAME_TAG_BLINK:
+            self.tail_eies_present   = _testbit(self.tail_subtype,1)
+            self.tail_ies_present    = _testbit(self.tail_subtype,2)
+            self.tail_cookie_present = _testbit(self.tail_subtype,3)
+            (flags,) = struct.unpack_from('<B',data,ptr)
+            ptr += 1
+            self.tail_flags  = flags
+            self.tail_listen = _testbit(flags,7)
+            self.tail_accel  = _testbit(flags,6)
+            self.tail_dcin   = _testbit(flags,5)
+            self.tail_salt   = _testbit(flags,4)
+            if self.tail_cookie_present:
+                (cookie,) = struct.unpack_from('16s',data,ptr)
+                ptr += 16
+                self.tail_cookie = cookie
+            if self.tail_ies_present:
+                (iec,) = struct.unpack_from('<B',data,ptr)
                 ptr += 1
-                self.tail_flags = flags
-                (ref,) = struct.unpack_from('8s',data,ptr)
-                self.tail_beacon = _byteswap(ref)
-                ptr += 8
-            elif self.tail_frmtype == self.FRAME_RANGING_REQUEST:
-                raise NotImplementedError('decode tail ranging request')
-            elif self.tail_frmtype == self.FRAME_RANGING_RESPONSE:
-                self.tail_owr = _testbit(self.tail_subtype,3)
-                (txtime,) = struct.unpack_from('5s',data,ptr)
-                ptr += 5
-                self.tail_txtime = TailWPANFrame.tsdecode(txtime)
-                if not self.tail_owr:
-                    (cnt,) = struct.unpack_from('<B',data,ptr)
+                self.tail_ies = {}
+                for i in range(iec):
+                    (id,) = struct.unpack_from('<B',data,ptr)
                     ptr += 1
-                    bits = 0
-                    self.tail_rxtimes = {}
-                    for i in range(0,cnt,8):
+                    idf = _getbits(id,6,2)
+                    if idf == 0:
                         (val,) = struct.unpack_from('<B',data,ptr)
                         ptr += 1
-                        bits |= val << i
-                    for i in range(cnt):
-                        if _testbit(bits,i):
-                            (addr,) = struct.unpack_from('8s',data,ptr)
-                            ptr += 8
-                        else:
-                            (addr,) = struct.unpack_from('2s',data,ptr)
-                            ptr += 2
-                        (rxdata,) = struct.unpack_from('5s',data,ptr)
-                        ptr += 5
-                        rxtime = TailWPANFrame.tsdecode(rxdata)
-                        self.tail_rxtimes[_byteswap(addr)] = rxtime
-                        if WPANFrame.match_if(_byteswap(addr)):
-                            self.tail_rxtime = rxtime
-            elif self.tail_frmtype == self.FRAME_CONFIG_REQUEST:
-                if self.tail_subtype == self.CONFIG_RESET:
-                    (magic,) = struct.unpack_from('<H',data,ptr)
-                    ptr += 2
-                    self.tail_reset_magic = magic
-                elif self.tail_subtype == self.CONFIG_ENUMERATE:
-                    (iter,) = struct.unpack_from('<H',data,ptr)
-                    ptr += 1
-                    self.tail_iterator = iter
-                elif self.tail_subtype == self.CONFIG_READ:
-                    (cnt,) = struct.unpack_from('<B',data,ptr)
-                    ptr += 1
-                    self.tail_config = {}
-                    for i in range(cnt):
-                        (key,) = struct.unpack_from('<H',data,ptr)
-                        ptr += 2
-                        self.tail_config[key] = None
-                elif self.tail_subtype == self.CONFIG_WRITE:
-                    (cnt,) = struct.unpack_from('<B',data,ptr)
-                    ptr += 1
-                    self.tail_config = {}
-                    for i in range(cnt):
-                        (key,) = struct.unpack_from('<H',data,ptr)
+                    elif idf == 1:
+                        (val,) = struct.unpack_from('<H',data,ptr)
                         ptr += 2
+                    elif idf == 2:
+                        (val,) = struct.unpack_from('<I',data,ptr)
+                        ptr += 4
+                    else:
                         (val,) = struct.unpack_from('<p',data,ptr)
                         ptr += len(val) + 1
-                        self.tail_config[key] = val
-                elif self.tail_subtype == self.CONFIG_DELETE:
-                    (cnt,) = struct.unpack_from('<B',data,ptr)
+                    if id in TailWPANFrame.IE_CONV:
+                        val = TailWPANFrame.IE_CONV[id](val)
+                    if id in TailWPANFrame.IE_KEYS:
+                        self.tail_ies[TailWPANFrame.IE_KEYS[id]] = val
+                    else:
+                        self.tail_ies['IE{:02X}'.format(id)] = val
+            if self.tail_eies_present:
+                raise NotImplementedError('decode tail EIEs')
+        elif self.tail_frmtype == self.FRAME_ANCHOR_BEACON:
+            (flags,) = struct.unpack_from('<B',data,ptr)
+            ptr += 1
+            self.tail_flags = flags
+            (ref,) = struct.unpack_from('8s',data,ptr)
+            self.tail_beacon = _byteswap(ref)
+            ptr += 8
+        elif self.tail_frmtype == self.FRAME_RANGING_REQUEST:
+            raise NotImplementedError('decode tail ranging request')
+        elif self.tail_frmtype == self.FRAME_RANGING_RESPONSE:
+            self.tail_owr = _testbit(self.tail_subtype,3)
+            (txtime,) = struct.unpack_from('5s',data,ptr)
+            ptr += 5
+            self.tail_txtime = TailWPANFrame.tsdecode(txtime)
+            if not self.tail_owr:
+                (cnt,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                bits = 0
+                self.tail_rxtimes = {}
+                for i in range(0,cnt,8):
+                    (val,) = struct.unpack_from('<B',data,ptr)
                     ptr += 1
-                    self.tail_config = {}
-                    for i in range(cnt):
-                        (key,) = struct.unpack_from('<H',data,ptr)
-                        ptr += 2
-                        self.tail_config[key] = None
-                elif self.tail_subtype == self.CONFIG_SALT:
-                    (salt,) = struct.unpack_from('<16s',data,ptr)
-                    ptr += 16
-                    self.tail_salt = salt
-                elif self.tail_subtype == self.CONFIG_TEST:
-                    (test,) = struct.unpack_from('<p',data,ptr)
-                    ptr += len(test) + 1
-                    self.tail_test = test
-                else:
-                    raise NotImplementedError('decode config request: {}'.format(self.tail_subtype))
-            elif self.tail_frmtype == self.FRAME_CONFIG_RESPONSE:
-                if self.tail_subtype == self.CONFIG_RESET:
-                    (magic,) = struct.unpack_from('<H',data,ptr)
-                    ptr += 2
-                elif self.tail_subtype == self.CONFIG_ENUMERATE:
-                    (iter,cnt,) = struct.unpack_from('<HB',data,ptr)
-                    ptr += 3
-                    self.tail_iterator = iter
-                    self.tail_config = {}
-                    for i in range(cnt):
-                        (key,) = struct.unpack_from('<H',data,ptr)
+                    bits |= val << i
+                for i in range(cnt):
+                    if _testbit(bits,i):
+                        (addr,) = struct.unpack_from('8s',data,ptr)
+                        ptr += 8
+                    else:
+                        (addr,) = struct.unpack_from('2s',data,ptr)
                         ptr += 2
-                        self.tail_config[key] = None
-                elif self.tail_subtype == self.CONFIG_READ:
-                    (cnt,) = struct.unpack_from('<B',data,ptr)
-                    ptr += 1
-                    self.tail_config = {}
-                    for i in range(cnt):
-                        (key,val,) = struct.unpack_from('<Hs',data,ptr)
-                        ptr += len(val) + 3
-                        self.tail_config[key] = val
-                elif self.tail_subtype == self.CONFIG_WRITE:
-                    (code,) = struct.unpack_from('<B',data,ptr)
-                    ptr += 1
-                    self.tail_code = code
-                elif self.tail_subtype == self.CONFIG_DELETE:
-                    (code,) = struct.unpack_from('<B',data,ptr)
-                    ptr += 1
-                    self.tail_code = code
-                elif self.tail_subtype == self.CONFIG_SALT:
-                    (salt,) = struct.unpack_from('<16s',data,ptr)
-                    ptr += 16
-                    self.tail_salt = salt
-                elif self.tail_subtype == self.CONFIG_TEST:
-                    (test,) = struct.unpack_from('<p',data,ptr)
-                    ptr += len(test) + 1
-                    self.tail_test = test
-                else:
-                    raise NotImplementedError('decode config response: {}'.format(self.tail_subtype))
-            elif self.tail_frmtype == self.FRAME_ANCHOR_AUX:
-                self.tail_timing = _testbit(self.tail_subtype,3)
-                txtime = _testbit(self.tail_subtype,2)
-                rxtime = _testbit(self.tail_subtype,1)
-                rxinfo = _testbit(self.tail_subtype,0)
-                if txtime:
-                    (tstamp,) = struct.unpack_from('5s',data,ptr)
+                    (rxdata,) = struct.unpack_from('5s',data,ptr)
                     ptr += 5
-                    self.tail_txtime = TailWPANFrame.tsdecode(tstamp)
-                if rxtime:
-                    self.tail_rxtimes = {}
-                if rxinfo:
-                    self.tail_rxinfos = {}
-                if rxtime or rxinfo:
-                    (cnt,) = struct.unpack_from('<B',data,ptr)
-                    ptr += 1
-                    bits = 0
-                    for i in range(0,cnt,8):
-                        (val,) = struct.unpack_from('<B',data,ptr)
-                        ptr += 1
-                        bits |= val << i
-                    for i in range(cnt):
-                        if _testbit(bits,i):
-                            (addr,) = struct.unpack_from('8s',data,ptr)
-                            ptr += 8
-                        else:
-                            (addr,) = struct.unpack_from('2s',data,ptr)
-                            ptr += 2
-                        if rxtime:
-                            (val,) = struct.unpack_from('5s',data,ptr)
-                            ptr += 5
-                            tstamp = TailWPANFrame.tsdecode(val)
-                            self.tail_rxtimes[_byteswap(addr)] = tstamp
-                            if WPANFrame.match_if(_byteswap(addr)):
-                                self.tail_rxtime = tstamp
-                        if rxinfo:
-                            rxinfo = struct.unpack_from('<4H',data,ptr)
-                            ptr += 8
-                            self.tail_rxinfos[_byteswap(addr)] = rxinfo
-                            if WPANFrame.match_if(_byteswap(addr)):
-                                self.tail_rxinfo = rxinfo
+                    rxtime = TailWPANFrame.tsdecode(rxdata)
+                    self.tail_rxtimes[_byteswap(addr)] = rxtime
+                    if WPANFrame.match_if(_byteswap(addr)):
+                        self.tail_rxtime = rxtime
+        elif self.tail_frmtype == self.FRAME_CONFIG_REQUEST:
+            if self.tail_subtype == self.CONFIG_RESET:
+                (magic,) = struct.unpack_from('<H',data,ptr)
+                ptr += 2
+                self.tail_reset_magic = magic
+            elif self.tail_subtype == self.CONFIG_ENUMERATE:
+                (iter,) = struct.unpack_from('<H',data,ptr)
+                ptr += 1
+                self.tail_iterator = iter
+            elif self.tail_subtype == self.CONFIG_READ:
+                (cnt,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                self.tail_config = {}
+                for i in range(cnt):
+                    (key,) = struct.unpack_from('<H',data,ptr)
+                    ptr += 2
+                    self.tail_config[key] = None
+            elif self.tail_subtype == self.CONFIG_WRITE:
+                (cnt,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                self.tail_config = {}
+                for i in range(cnt):
+                    (key,) = struct.unpack_from('<H',data,ptr)
+                    ptr += 2
+                    (val,) = struct.unpack_from('<p',data,ptr)
+                    ptr += len(val) + 1
+                    self.tail_config[key] = val
+            elif self.tail_subtype == self.CONFIG_DELETE:
+                (cnt,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                self.tail_config = {}
+                for i in range(cnt):
+                    (key,) = struct.unpack_from('<H',data,ptr)
+                    ptr += 2
+                    self.tail_config[key] = None
+            elif self.tail_subtype == self.CONFIG_SALT:
+                (salt,) = struct.unpack_from('<16s',data,ptr)
+                ptr += 16
+                self.tail_salt = salt
+            elif self.tail_subtype == self.CONFIG_TEST:
+                (test,) = struct.unpack_from('<p',data,ptr)
+                ptr += len(test) + 1
+                self.tail_test = test
             else:
-                raise NotImplementedError('decode tail frametype: {}'.format(self.tail_frmtype))
-    ## Tail encrypted protocol
-        elif magic == TailWPANFrame.TAIL_MAGIC_ENC:
-            self.tail_protocol = self.TAIL_PROTO_ENC
-            self.tail_payload = data[ptr:]
-    ## Tail protocols end
+                raise NotImplementedError('decode config request: {}'.format(self.tail_subtype))
+        elif self.tail_frmtype == self.FRAME_CONFIG_RESPONSE:
+            if self.tail_subtype == self.CONFIG_RESET:
+                (magic,) = struct.unpack_from('<H',data,ptr)
+                ptr += 2
+            elif self.tail_subtype == self.CONFIG_ENUMERATE:
+                (iter,cnt,) = struct.unpack_from('<HB',data,ptr)
+                ptr += 3
+                self.tail_iterator = iter
+                self.tail_config = {}
+                for i in range(cnt):
+                    (key,) = struct.unpack_from('<H',data,ptr)
+                    ptr += 2
+                    self.tail_config[key] = None
+            elif self.tail_subtype == self.CONFIG_READ:
+                (cnt,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                self.tail_config = {}
+                for i in range(cnt):
+                    (key,val,) = struct.unpack_from('<Hs',data,ptr)
+                    ptr += len(val) + 3
+                    self.tail_config[key] = val
+            elif self.tail_subtype == self.CONFIG_WRITE:
+                (code,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                self.tail_code = code
+            elif self.tail_subtype == self.CONFIG_DELETE:
+                (code,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                self.tail_code = code
+            elif self.tail_subtype == self.CONFIG_SALT:
+                (salt,) = struct.unpack_from('<16s',data,ptr)
+                ptr += 16
+                self.tail_salt = salt
+            elif self.tail_subtype == self.CONFIG_TEST:
+                (test,) = struct.unpack_from('<p',data,ptr)
+                ptr += len(test) + 1
+                self.tail_test = test
+            else:
+                raise NotImplementedError('decode config response: {}'.format(self.tail_subtype))
+        elif self.tail_frmtype == self.FRAME_ANCHOR_AUX:
+            self.tail_timing = _testbit(self.tail_subtype,3)
+            txtime = _testbit(self.tail_subtype,2)
+            rxtime = _testbit(self.tail_subtype,1)
+            rxinfo = _testbit(self.tail_subtype,0)
+            if txtime:
+                (tstamp,) = struct.unpack_from('5s',data,ptr)
+                ptr += 5
+                self.tail_txtime = TailWPANFrame.tsdecode(tstamp)
+            if rxtime:
+                self.tail_rxtimes = {}
+            if rxinfo:
+                self.tail_rxinfos = {}
+            if rxtime or rxinfo:
+                (cnt,) = struct.unpack_from('<B',data,ptr)
+                ptr += 1
+                bits = 0
+                for i in range(0,cnt,8):
+                    (val,) = struct.unpack_from('<B',data,ptr)
+                    ptr += 1
+                    bits |= val << i
+                for i in range(cnt):
+                    if _testbit(bits,i):
+                        (addr,) = struct.unpack_from('8s',data,ptr)
+                        ptr += 8
+                    else:
+                        (addr,) = struct.unpack_from('2s',data,ptr)
+                        ptr += 2
+                    if rxtime:
+                        (val,) = struct.unpack_from('5s',data,ptr)
+                        ptr += 5
+                        tstamp = TailWPANFrame.tsdecode(val)
+                        self.tail_rxtimes[_byteswap(addr)] = tstamp
+                        if WPANFrame.match_if(_byteswap(addr)):
+                            self.tail_rxtime = tstamp
+                    if rxinfo:
+                        rxinfo = struct.unpack_from('<4H',data,ptr)
+                        ptr += 8
+                        self.tail_rxinfos[_byteswap(addr)] = rxinfo
+                        if WPANFrame.match_if(_byteswap(addr)):
+                            self.tail_rxinfo = rxinfo
         else:
-            self.tail_protocol = self.TAIL_PROTO_NONE
-            self.tail_payload = data[ptr-1:]
+            raise NotImplementedError('decode tail frametype: {}'.format(self.tail_frmtype))
             
     def encode(self):
         data = WPANFrame.encode(self)
@@ -4,10 +4,14 @@ import sys
 import time
 import logger
 import threading
+import concurrent.futures
 
 from tail import *
 from wpan import *
 from config import *
+from attrcache import *
+
+import numpy as np
 
 
 log = logger.getLogger(__name__)
@@ -20,30 +24,21 @@ class Anchor(Tail):
         self.rpc = server.rpc
         self.server = server
         self.active = False
-        self.exit = threading.Event()
-        self.thread = threading.Thread(target=self.run)
-        self.thread.start()
-
-
-    def run(self):
-        log.debug(f'Anchor {self.name} <{self.eui64}> registered')
-        while not self.exit.is_set():
-            try:
-                self.ping()
-                if not self.active:
-                    self.activate()
-            except:
-                if self.active:
-                    self.deactivate()
-            self.exit.wait(10)
-
-    def stop(self):
-        self.exit.set()
+        self.attrs = AttrCache()
+
+    def update_coord(self, coord):
+        self.coord.update(coord)
+        self.server.update_anchor_geometry()
 
     def activate(self):
         log.debug(f'Activating anchor {self.name} <{self.eui64}>')
         self.active = True
-        self.reset()
+        self.attrs.flush()
+        self.rpc_call_async('RESET').add_done_callback(self.reset_done)
+
+    def reset_done(self, future):
+        if future.exception() is None:
+            self.server.beacons.resync(self)
 
     def deactivate(self):
         log.debug(f'Deactivating anchor {self.name} <{self.eui64}>')
@@ -58,14 +53,27 @@ class Anchor(Tail):
         else:
             raise ConnectionError
 
+    def rpc_call_async(self, func, **kwargs):
+        if self.active:
+            future = self.rpc.call_async(self.eui64, func, **kwargs)
+        else:
+            future = concurrent.futures.Future()
+            future.set_exception(ConnectionError())
+        future.add_done_callback(self.rpc_done)
+        return future
+
+    def rpc_done(self, future):
+        if future.exception() is not None:
+            log.debug(f'Anchor {self.name} <{self.eui64}> RPC failed: {future.exception()!r}')
+
     def reset(self):
         return self.rpc_call('RESET')
 
     def register_tag(self, tag):
-       return self.rpc_call('REGISTER', EUI64=tag.eui64)
+        return self.rpc_call_async('REGISTER', EUI64=tag.eui64)
 
     def unregister_tag(self, tag):
-        return self.rpc_call('UNREGISTER', EUI64=tag.eui64)
+        return self.rpc_call_async('UNREGISTER', EUI64=tag.eui64)
 
     def xmit_frame(self, frame):
         return self.rpc_call('WPAN-XMIT', FRAME=frame.hex())
@@ -73,18 +81,54 @@ class Anchor(Tail):
     def xmit_beacon(self, bref):
         return self.rpc_call('WPAN-BEACON', BREF=bref)
 
+    def get_dtattr_async(self, attr, format):
+        return self.attrs.get(('dt',attr,format), attr, lambda: self.rpc_call_async('GETDTATTR', ATTR=attr, FORMAT=format))
+
     def get_dtattr(self, attr, format):
-        return self.rpc_call('GET_DTATTR', ATTR=attr, FORMAT=format)
+        return self.get_dtattr_async(attr, format).result()
+
+    def get_dwattr_async(self, attr):
+        return self.attrs.get(('dw',attr), attr, lambda: self.rpc_call_async('GETDWATTR', ATTR=attr))
 
     def get_dwattr(self, attr):
-        return self.rpc_call('GET_DWATTR', ATTR=attr)
+        return self.get_dwattr_async(attr).result()
+
+    def set_dwattr_async(self, attr, value):
+        # The anchor replies with the value read back, which becomes the cached one
+        self.attrs.invalidate(('dwconfig',))
+        return self.attrs.put(('dw',attr), attr, self.rpc_call_async('SETDWATTR', ATTR=attr, VALUE=value))
 
     def set_dwattr(self, attr, value):
-        return self.rpc_call('GET_DWATTR', ATTR=attr, VALUE=value)
+        return self.set_dwattr_async(attr, value).result()
+
+    def get_dwconfig_async(self):
+        return self.attrs.get(('dwconfig',), 'dwconfig', lambda: self.rpc_call_async('GETDWCONFIG'))
+
+    def get_dwconfig(self):
+        return self.get_dwconfig_async().result()
+
+    def flush_attrs(self):
+        self.attrs.flush()
 
     def get_dwstat(self, attr):
-        return self.rpc_call('GET_DWSTAT', ATTR=attr)
+        return self.rpc_call('GETDWSTAT', ATTR=attr)
 
     def get_dwstats(self):
-        return self.rpc_call('GET_DWSTATS')
+        return self.rpc_call('GETDWSTATS')
+
+
+class AnchorGeometry():
+
+    def __init__(self, anchors=()):
+        self.anchors = list(anchors)
+        self.index = { anchor.key:i for (i,anchor) in enumerate(self.anchors) }
+        self.coords = np.zeros((len(self.anchors),3))
+        for (i,anchor) in enumerate(self.anchors):
+            self.coords[i] = anchor.coord.value()
+        self.dists = np.linalg.norm(self.coords[:,None,:] - self.coords[None,:,:], axis=2)
+
+    def __len__(self):
+        return len(self.anchors)
 
+    def distance(self, key1, key2):
+        return self.dists[self.index[key1],self.index[key2]]
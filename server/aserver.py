@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+
+import time
+import asyncio
+import logger
+import threading
+import collections
+import concurrent.futures
+
+import paho.mqtt.client as mqtt
+
+from timer import *
+from config import *
+from server import *
+from ingest import *
+from pool import *
+
+
+log = logger.getLogger(__name__)
+
+
+class AsyncIngestQueue(IngestQueue):
+
+    # Events per loop callback, so that MQTT I/O and timers interleave
+    SLICE = 64
+
+    def __init__(self, server, length, policy):
+        self.loop = server.loop
+        self.scheduled = False
+        IngestQueue.__init__(self, server, length, policy)
+
+    def start(self):
+        pass
+
+    def put(self, evnt):
+        IngestQueue.put(self, evnt)
+        with self.lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.loop.call_soon_threadsafe(self.drain)
+
+    def drain(self):
+        for i in range(self.SLICE):
+            with self.lock:
+                if not self.running or not self.queue:
+                    self.scheduled = False
+                    return
+                evnt = self.next()
+            self.process(evnt)
+        self.loop.call_soon(self.drain)
+
+
+class AsyncLaterationPool(LaterationPool):
+
+    # Sessions are prepared and applied on the loop, only the solve runs in the executor
+
+    def __init__(self, loop, executor):
+        self.started  = time.time()
+        self.solver   = None
+        self.mode     = 'asyncio'
+        self.lock     = threading.Lock()
+        self.solves   = { 'solves':0, 'warm':0, 'iterations':0, 'rejected':0, 'suppressed':0, 'quality':0, 'gdop':0.0, 'rms':0.0 }
+        self.rejected = collections.Counter()
+        self.workers  = []
+        self.loop     = loop
+        self.executor = executor
+        self.tails    = {}
+        self.inflight = 0
+        self.count    = 0
+        self.busy     = 0.0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+
+    def stop(self):
+        pass
+
+    def submit(self, rng):
+        return asyncio.run_coroutine_threadsafe(self.laterate(rng, time.time()), self.loop)
+
+    def solve(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    async def laterate(self, rng, queued):
+        start = time.time()
+        wait = start - queued
+        self.count += 1
+        self.inflight += 1
+        self.wait_sum += wait
+        self.wait_max = max(self.wait_max, wait)
+        # Fixes of one tag are applied in session order
+        key = rng.device.key if rng.device is not None else rng.rangid
+        prev = self.tails.get(key)
+        task = asyncio.current_task()
+        self.tails[key] = task
+        result = None
+        try:
+            rng.server.sessions.record(rng)
+            problem = rng.prepare()
+            if problem is not None:
+                result = await self.loop.run_in_executor(self.executor, rng.solve, problem)
+        except Exception:
+            log.exception(f'Lateration failed')
+        if prev is not None:
+            await asyncio.wait([prev])
+        try:
+            if result is not None:
+                rng.update(*result)
+            rng.complete()
+        except Exception:
+            log.exception(f'Lateration failed')
+        if self.tails.get(key) is task:
+            del self.tails[key]
+        self.inflight -= 1
+        self.busy += time.time() - start
+
+    def get_stats(self):
+        elapsed = time.time() - self.started
+        stats = {
+            'mode':        self.mode,
+            'workers':     config.rtls.executor_threads,
+            'processed':   self.count,
+            'batches':     0,
+            'depth':       [ self.inflight ],
+            'utilisation': [ round(self.busy / elapsed, 4) ],
+            'wait_avg':    self.wait_sum / max(self.count, 1),
+            'wait_max':    self.wait_max,
+        }
+        stats.update(self.get_solve_stats())
+        return stats
+
+
+class AsyncServer(Server):
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(config.rtls.executor_threads)
+        self.running = False
+        self.tasks = {}
+        self.misc = None
+        Server.__init__(self)
+
+
+    def init_timers(self):
+        return AsyncTimerLoop(self.loop)
+
+    def init_pool(self):
+        return AsyncLaterationPool(self.loop, self.executor)
+
+    def init_ingest(self):
+        return AsyncIngestQueue(self, config.ingest.queue_len, config.ingest.policy)
+
+    def mqtt_connect(self):
+        self.mqtt.on_socket_open = self.mqtt_on_socket_open
+        self.mqtt.on_socket_close = self.mqtt_on_socket_close
+        self.mqtt.on_socket_register_write = self.mqtt_on_socket_register_write
+        self.mqtt.on_socket_unregister_write = self.mqtt_on_socket_unregister_write
+        Server.mqtt_connect(self)
+
+
+    def run(self):
+        log.debug(f'starting asyncio server')
+        self.running = True
+        self.misc = self.loop.create_task(self.mqtt_misc())
+        try:
+            self.loop.run_forever()
+        finally:
+            self.running = False
+
+    def stop(self):
+        log.debug(f'stopping asyncio server')
+        Server.stop(self)
+        self.loop.call_soon_threadsafe(self.shutdown)
+        self.executor.shutdown(wait=False)
+
+    def shutdown(self):
+        for task in self.tasks.values():
+            task.cancel()
+        if self.misc:
+            self.misc.cancel()
+        self.loop.stop()
+
+
+    def call_soon(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+
+    def start_supervisor(self):
+        self.call_soon(self.start_supervisor_task)
+
+    def start_supervisor_task(self):
+        self.tasks['supervisor'] = self.loop.create_task(self.supervise_anchors())
+
+    async def supervise_anchors(self):
+        while not self.supervisor.exit.is_set():
+            start = self.loop.time()
+            try:
+                await self.loop.run_in_executor(self.executor, self.supervisor.poll)
+            except Exception:
+                log.exception(f'Anchor supervision failed')
+            await asyncio.sleep(max(0, self.supervisor.interval - (self.loop.time() - start)))
+
+
+    async def mqtt_misc(self):
+        while self.running:
+            if self.mqtt.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                try:
+                    self.mqtt.reconnect()
+                except OSError:
+                    log.warning(f'MQTT reconnect failed')
+            await asyncio.sleep(1)
+
+    def mqtt_on_socket_open(self, client, userdata, sock):
+        self.call_soon(self.loop.add_reader, sock, client.loop_read)
+
+    def mqtt_on_socket_close(self, client, userdata, sock):
+        self.call_soon(self.loop.remove_reader, sock)
+
+    def mqtt_on_socket_register_write(self, client, userdata, sock):
+        self.call_soon(self.loop.add_writer, sock, client.loop_write)
+
+    def mqtt_on_socket_unregister_write(self, client, userdata, sock):
+        self.call_soon(self.loop.remove_writer, sock)
+
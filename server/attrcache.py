@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+import time
+import logger
+import threading
+import functools
+
+from config import *
+
+
+log = logger.getLogger(__name__)
+
+
+## Per-anchor cache of slowly changing attributes
+##
+## Entries are keyed by (kind,attr) and expire after a per-attribute TTL:
+## a TTL of null never expires, a TTL of 0 disables caching.
+
+class AttrCache():
+
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.entries = {}
+        self.hits    = 0
+        self.misses  = 0
+        self.flushes = 0
+
+    def get_ttl(self, attr):
+        ttls = config.attr_cache.ttl or {}
+        if attr in ttls:
+            return ttls[attr]
+        return config.attr_cache.default_ttl
+
+    def get(self, key, attr, fetch):
+        # Values are futures, so concurrent misses share one RPC
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        return self.put(key, attr, fetch())
+
+    def put(self, key, attr, future):
+        ttl = self.get_ttl(attr)
+        with self.lock:
+            if ttl == 0:
+                self.entries.pop(key, None)
+                return future
+            self.entries[key] = (future, None if ttl is None else time.monotonic() + ttl)
+        future.add_done_callback(functools.partial(self.failed, key))
+        return future
+
+    def failed(self, key, future):
+        if future.exception() is not None:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] is future:
+                    del self.entries[key]
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def flush(self):
+        with self.lock:
+            self.entries.clear()
+            self.flushes += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits':    self.hits,
+                'misses':  self.misses,
+                'flushes': self.flushes,
+            }
@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+
+import logger
+import threading
+
+from config import *
+
+
+log = logger.getLogger(__name__)
+
+
+class BeaconReconciler():
+
+    def __init__(self, server):
+        self.server     = server
+        self.retry      = config.ranging.beacon_retry
+        self.retry_max  = config.ranging.beacon_retry_max
+        self.retries    = config.ranging.beacon_retries
+        self.lock       = threading.Lock()
+        self.desired    = {}
+        self.registered = {}
+        self.inflight   = set()
+        self.attempts   = {}
+        self.timers     = {}
+        self.stats      = {
+            'changes':      0,
+            'coalesced':    0,
+            'sent':         0,
+            'synced':       0,
+            'failed':       0,
+            'retried':      0,
+            'abandoned':    0,
+        }
+
+    def assign(self, tag, beacon):
+        # Only the latest beacon of a tag matters, older changes are dropped
+        with self.lock:
+            self.stats['changes'] += 1
+            self.desired[tag.key] = (tag,beacon)
+            if tag.key in self.inflight or tag.key in self.timers:
+                self.stats['coalesced'] += 1
+                return
+        self.reconcile(tag.key)
+
+    def resync(self, anchor):
+        # The anchor has forgotten its tags, e.g. after a RESET, and tags
+        # given up on while it was away get a fresh set of retries
+        with self.lock:
+            keys = { key for (key,reg) in self.registered.items() if reg is anchor }
+            for key in keys:
+                del self.registered[key]
+            keys |= { key for (key,(tag,beacon)) in self.desired.items() if beacon is anchor }
+            for key in keys:
+                self.attempts.pop(key, None)
+        for key in keys:
+            self.reconcile(key)
+
+    def reconcile(self, key):
+        with self.lock:
+            if key in self.inflight or key not in self.desired:
+                return
+            (tag,beacon) = self.desired[key]
+            current = self.registered.get(key)
+            if current is beacon:
+                self.attempts.pop(key, None)
+                return
+            self.inflight.add(key)
+            self.stats['sent'] += 1
+        log.debug(f'BeaconReconciler: {tag.name} {current.name if current else None} => {beacon.name if beacon else None}')
+        calls = []
+        if current is not None:
+            calls.append(current.unregister_tag(tag))
+        if beacon is not None:
+            calls.append(beacon.register_tag(tag))
+        state = { 'left': len(calls), 'ok': True }
+        def done(future):
+            with self.lock:
+                state['ok'] &= future.exception() is None
+                state['left'] -= 1
+                if state['left'] > 0:
+                    return
+            self.completed(key, beacon, state['ok'])
+        if calls:
+            for future in calls:
+                future.add_done_callback(done)
+        else:
+            self.completed(key, beacon, True)
+
+    def completed(self, key, beacon, ok):
+        with self.lock:
+            self.inflight.discard(key)
+            if ok:
+                self.registered[key] = beacon
+                self.attempts.pop(key, None)
+                self.stats['synced'] += 1
+            else:
+                self.stats['failed'] += 1
+                attempt = self.attempts.get(key, 0) + 1
+                if attempt > self.retries:
+                    log.warning(f'BeaconReconciler: giving up on tag {key}')
+                    self.attempts.pop(key, None)
+                    self.stats['abandoned'] += 1
+                    return
+                self.attempts[key] = attempt
+                delay = min(self.retry * 2**(attempt-1), self.retry_max)
+                timer = self.server.timers.Timer(delay, self.retry_expire, key=key)
+                self.timers[key] = timer
+                timer.arm()
+                return
+        # The beacon may have changed again while the calls were in flight
+        self.reconcile(key)
+
+    def retry_expire(self, key):
+        with self.lock:
+            self.timers.pop(key, None)
+            self.stats['retried'] += 1
+        self.reconcile(key)
+
+    def stop(self):
+        with self.lock:
+            timers = list(self.timers.values())
+            self.timers.clear()
+        for timer in timers:
+            timer.unarm()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['registered'] = len(self.registered)
+            stats['pending'] = len(self.inflight) + len(self.timers)
+        return stats
+
+
+class RemoteBeacons():
+
+    # Shards other than the controller forward beacon changes to it,
+    # keeping every anchor registration in one BeaconReconciler.
+
+    def __init__(self, server, controller):
+        self.server     = server
+        self.controller = controller
+        self.retry      = config.ranging.beacon_retry
+        self.retries    = config.ranging.beacon_retries
+        self.lock       = threading.Lock()
+        self.desired    = {}
+        self.inflight   = set()
+        self.attempts   = {}
+        self.timers     = {}
+        self.stats      = {
+            'changes':      0,
+            'coalesced':    0,
+            'sent':         0,
+            'synced':       0,
+            'failed':       0,
+            'abandoned':    0,
+        }
+
+    def assign(self, tag, beacon):
+        with self.lock:
+            self.stats['changes'] += 1
+            self.desired[tag.key] = (tag,beacon)
+            self.attempts.pop(tag.key, None)
+            if tag.key in self.inflight or tag.key in self.timers:
+                self.stats['coalesced'] += 1
+                return
+        self.forward(tag.key)
+
+    def resync(self, anchor):
+        pass
+
+    def forward(self, key):
+        with self.lock:
+            self.timers.pop(key, None)
+            if key in self.inflight or key not in self.desired:
+                return
+            (tag,beacon) = self.desired[key]
+            self.inflight.add(key)
+            self.stats['sent'] += 1
+        future = self.server.rpc.call_async(self.controller, 'ASSIGNBEACON', TAG=tag.eui64,
+                                            BEACON=beacon.eui64 if beacon else None)
+        future.add_done_callback(lambda future: self.completed(key, beacon, future.exception() is None))
+
+    def completed(self, key, beacon, ok):
+        with self.lock:
+            self.inflight.discard(key)
+            current = self.desired[key][1]
+            if ok:
+                self.stats['synced'] += 1
+                self.attempts.pop(key, None)
+                if current is beacon:
+                    return
+            else:
+                self.stats['failed'] += 1
+                attempt = self.attempts.get(key, 0) + 1
+                if attempt > self.retries:
+                    log.warning(f'RemoteBeacons: giving up on tag {key}')
+                    self.attempts.pop(key, None)
+                    self.stats['abandoned'] += 1
+                    return
+                self.attempts[key] = attempt
+                timer = self.server.timers.Timer(self.retry, self.forward, key=key)
+                self.timers[key] = timer
+                timer.arm()
+                return
+        self.forward(key)
+
+    def stop(self):
+        with self.lock:
+            timers = list(self.timers.values())
+            self.timers.clear()
+        for timer in timers:
+            timer.unarm()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['controller'] = self.controller
+            stats['pending'] = len(self.inflight) + len(self.timers)
+        return stats
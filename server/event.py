@@ -1,5 +1,6 @@
 #!/usr/bin/python3
 
+import time
 import logger
 import hashlib
 
@@ -11,6 +12,26 @@ from wpan import *
 log = logger.getLogger(__name__)
 
 
+def make_ranging_ref(addr, seq):
+    md5 = hashlib.md5()
+    msg = struct.pack('8sB', addr, seq&0xff)
+    md5.update(msg)
+    ref =  md5.digest()
+    return ref[:8]
+
+def frame_ranging_ref(frame):
+    if frame.tail_protocol == frame.TAIL_PROTO_STD:
+        if frame.tail_frmtype == frame.FRAME_TAG_BLINK:
+            return make_ranging_ref(frame.src_addr, frame.frame_seqnum)
+        elif frame.tail_frmtype == frame.FRAME_ANCHOR_BEACON:
+            return frame.tail_beacon
+        elif frame.tail_frmtype == frame.FRAME_RANGING_REQUEST:
+            raise NotImplementedError
+        elif frame.tail_frmtype == frame.FRAME_RANGING_RESPONSE:
+            return make_ranging_ref(frame.src_addr, frame.frame_seqnum-1)
+    return None
+
+
 class TEvent():
 
     TEV_TYPE = 0
@@ -23,13 +44,14 @@ class RFEvent(TEvent):
 
     TEV_TYPE = 1
 
-    def __init__(self,anchor,dir,times,frame,finfo):
+    def __init__(self,anchor,dir,times,frame,finfo,lazy=False):
         TEvent.__init__(self,RFEvent.TEV_TYPE)
         self.key    = anchor.key
+        self.recv   = time.monotonic()
         self.anchor = anchor
         self.direct = dir
         self.times  = times
-        self.frame  = TailWPANFrame(frame,finfo)
+        self.frame  = TailWPANFrame(frame,finfo,lazy=lazy)
         self.finfo  = self.frame.timestamp.tsinfo
         self.rawts  = self.frame.timestamp.tsinfo.rawts
 
@@ -52,27 +74,10 @@ class RFEvent(TEvent):
         return self.rawts
 
     def make_ranging_ref(self, addr, seq):
-        md5 = hashlib.md5()
-        msg = struct.pack('8sB', addr, seq&0xff)
-        md5.update(msg)
-        ref =  md5.digest()
-        return ref[:8]
+        return make_ranging_ref(addr, seq)
 
     def get_ranging_ref(self):
-        if self.frame.tail_protocol == self.frame.TAIL_PROTO_STD:
-            if self.frame.tail_frmtype == self.frame.FRAME_TAG_BLINK:
-                tag = self.frame.src_addr
-                seq = self.frame.frame_seqnum
-                return self.make_ranging_ref(tag,seq)
-            elif self.frame.tail_frmtype == self.frame.FRAME_ANCHOR_BEACON:
-                return self.frame.tail_beacon
-            elif self.frame.tail_frmtype == self.frame.FRAME_RANGING_REQUEST:
-                raise NotImplementedError
-            elif self.frame.tail_frmtype == self.frame.FRAME_RANGING_RESPONSE:
-                tag = self.frame.src_addr
-                seq = self.frame.frame_seqnum
-                return self.make_ranging_ref(tag, seq-1)
-        return None
+        return frame_ranging_ref(self.frame)
 
     def get_rx_level(self):
         POW = self.finfo.cir_pwr
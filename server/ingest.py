@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+import logger
+import threading
+import collections
+
+from wpan import *
+from config import *
+
+
+log = logger.getLogger(__name__)
+
+
+class IngestQueue():
+
+    DROP_OLDEST   = 'oldest'
+    DROP_NONBLINK = 'nonblink'
+    DROP_PRIORITY = 'priority'
+
+    FRAME_NAMES = {
+        TailWPANFrame.FRAME_TAG_BLINK:        'blink',
+        TailWPANFrame.FRAME_ANCHOR_BEACON:    'beacon',
+        TailWPANFrame.FRAME_RANGING_REQUEST:  'request',
+        TailWPANFrame.FRAME_RANGING_RESPONSE: 'response',
+        TailWPANFrame.FRAME_CONFIG_REQUEST:   'config',
+        TailWPANFrame.FRAME_CONFIG_RESPONSE:  'config',
+    }
+
+    def __init__(self, server, length, policy):
+        if policy not in (self.DROP_OLDEST, self.DROP_NONBLINK, self.DROP_PRIORITY):
+            raise ValueError(f'Unknown ingest drop policy {policy}')
+        self.server   = server
+        self.length   = length
+        self.policy   = policy
+        self.queue    = collections.deque()
+        self.lock     = threading.Condition()
+        self.overload = False
+        self.running  = True
+        self.stats    = {}
+        self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+
+    def frame_name(self, evnt):
+        return self.FRAME_NAMES.get(evnt.frame.tail_frmtype, 'other')
+
+    def count(self, name, what):
+        if name not in self.stats:
+            self.stats[name] = { 'queued':0, 'dropped':0, 'processed':0 }
+        self.stats[name][what] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = { name:dict(count) for (name,count) in self.stats.items() }
+            stats['depth'] = len(self.queue)
+        return stats
+
+
+    def priority(self, evnt):
+        frm = evnt.frame
+        if frm.tail_frmtype == frm.FRAME_ANCHOR_BEACON:
+            rng = self.server.sessions.get(frm.tail_beacon)
+            tag = rng.device if rng else None
+        else:
+            tag = self.server.tags.get(frm.get_src_eui())
+        if tag:
+            return tag.priority
+        return 0
+
+    def select_drop(self):
+        if self.policy == self.DROP_NONBLINK:
+            for (index,item) in enumerate(self.queue):
+                if item[0].frame.tail_frmtype != TailWPANFrame.FRAME_TAG_BLINK:
+                    return index
+        elif self.policy == self.DROP_PRIORITY:
+            index = min(range(len(self.queue)), key=lambda i: self.queue[i][1])
+            return index
+        return 0
+
+    def drop(self, index):
+        evnt = self.queue[index][0]
+        del self.queue[index]
+        self.count(self.frame_name(evnt), 'dropped')
+
+    def put(self, evnt):
+        name = self.frame_name(evnt)
+        prio = self.priority(evnt) if self.policy == self.DROP_PRIORITY else 0
+        with self.lock:
+            if len(self.queue) >= self.length:
+                if not self.overload:
+                    self.overload = True
+                    log.warning(f'Ingest queue overload, dropping frames ({self.policy})')
+                index = self.select_drop()
+                if self.policy == self.DROP_PRIORITY and self.queue[index][1] > prio:
+                    self.count(name, 'dropped')
+                    return
+                self.drop(index)
+            self.queue.append((evnt,prio))
+            self.count(name, 'queued')
+            self.lock.notify()
+
+    def next(self):
+        (evnt,prio) = self.queue.popleft()
+        if self.overload and len(self.queue) < self.length // 2:
+            self.overload = False
+            log.warning(f'Ingest queue recovered')
+        return evnt
+
+    def process(self, evnt):
+        try:
+            self.server.recv_rf_event(evnt)
+        except Exception:
+            log.exception(f'Unable to handle RF event from {evnt.key}')
+        with self.lock:
+            self.count(self.frame_name(evnt), 'processed')
+
+    def run(self):
+        while True:
+            with self.lock:
+                while self.running and not self.queue:
+                    self.lock.wait()
+                if not self.running:
+                    break
+                evnt = self.next()
+            self.process(evnt)
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+
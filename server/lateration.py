@@ -2,6 +2,7 @@
 
 import math
 import logger
+import logging
 import random
 import threading
 
@@ -9,6 +10,7 @@ from wpan import *
 from tdoa import *
 from dwarf import *
 from coord import *
+from timer import *
 
 from config import config
 
@@ -24,6 +26,14 @@ class Lateration():
     ONE_WAY_RANGING = 1
     TWO_WAY_RANGING = 2
 
+    solver = None
+    warm_solver = None
+    batch_solver = None
+    ransac_solver = None
+
+    min_anchors = 0
+    ref_anchors = 0
+
     def __init__(self, server, rangid, method=0):
         self.rangid = rangid
         self.server = server
@@ -32,43 +42,194 @@ class Lateration():
         self.blinks = None
         self.active = False
         self.thread = None
-        self.ranging_timer = self.server.timers.Timer(config.ranging.ranging_timer, self.ranging_expire)
-        self.timeout_timer = self.server.timers.Timer(config.ranging.timeout_timer, self.timeout_expire)
+        self.first  = None
+        self.window = config.ranging.ranging_timer
+        self.expect = None
+        self.reported = set()
+        self.laterating = False
+        self.ranging_timer = self.server.sessions.Timer(config.ranging.ranging_timer, self.ranging_expire)
+        self.quorum_timer  = self.server.sessions.Timer(config.ranging.quorum_timer, self.quorum_expire)
+        self.timeout_timer = self.server.sessions.Timer(config.ranging.timeout_timer, self.timeout_expire)
 
     def start(self):
-        self.start_time = time.time()
+        self.start_time = clock()
         self.timeout_timer.arm()
         self.blinks = ( {}, {}, {} )
+        self.geometry = self.server.geometry
+        self.index = self.geometry.index
+        self.times = np.zeros((3,len(self.geometry)), dtype=np.int64)
+        self.valid = np.zeros((3,len(self.geometry)), dtype=bool)
         self.active = True
         log.debug('Lateration::start')
 
+    def leave_pending(self):
+        older = []
+        if self.device and self in self.device.pending:
+            index = self.device.pending.index(self)
+            older = self.device.pending[:index]
+            del self.device.pending[:index+1]
+        return older
+
     def finish(self):
+        with self.server.sessions.lock:
+            self.leave_pending()
+            self.blinks = None
+            self.active = False
         self.ranging_timer.unarm()
+        self.quorum_timer.unarm()
         self.timeout_timer.unarm()
-        self.blinks = None
-        self.active = False
         self.thread = None
         self.server.finish_ranging(self)
-        log.debug('Lateration::finish @ {}s'.format(time.time() - self.start_time))
-
-    def update(self,coord):
-        if self.device:
-            self.device.update_coord(coord)
+        log.debug('Lateration::finish @ {}s'.format(clock() - self.start_time))
+
+    def update(self,coord,info=None):
+        if info is None:
+            info = {}
+        info['suppressed'] = not self.check_quality(coord,info)
+        self.server.solver_stats(info)
+        if self.device and not info['suppressed']:
+            self.device.update_coord(coord,info.get('rms'))
+
+    def check_quality(self,coord,info):
+        if not np.all(np.isfinite(coord)):
+            log.debug('{}: fix suppressed, not finite'.format(type(self).__name__))
+            return False
+        for (key,limit) in (('gdop',config.ranging.max_gdop),('rms',config.ranging.max_rms)):
+            if limit is not None and key in info and not info[key] <= limit:
+                log.debug('{}: fix suppressed, {} {:.3f} > {}'.format(type(self).__name__,key.upper(),info[key],limit))
+                return False
+        return True
 
     def laterate(self):
+        self.server.sessions.record(self)
+        problem = self.prepare()
+        if problem is not None:
+            try:
+                (coord,info) = self.solve(problem)
+                self.update(coord,info)
+            except:
+                log.exception('{} failed'.format(type(self).__name__))
+        self.complete()
+
+    def robust(self):
+        return config.ranging.ransac and self.ransac_solver is not None
+
+    def get_batch_solver(self):
+        # RANSAC batches the anchor subsets of a single session instead,
+        # and warm starts need the per-tag start position
+        if self.robust() or (config.ranging.warm_start and self.warm_solver):
+            return None
+        return self.batch_solver
+
+    def solve(self,problem):
+        if self.robust():
+            (coord,cond,info) = self.server.solve(self.ransac_solver, *problem, delta=0.01,
+                                                  threshold=config.ranging.ransac_threshold,
+                                                  max_subsets=config.ranging.ransac_subsets)
+            info['rejected'] = [ self.geometry.anchors[self.used[i]] for i in info['rejected'] ]
+            for anchor in info['rejected']:
+                log.debug(' * Rejected: {} <{}>'.format(anchor.name,anchor.eui64))
+        elif config.ranging.warm_start and self.warm_solver:
+            start = self.device.recent_coord(config.ranging.warm_age)
+            (coord,cond,info) = self.server.solve(self.warm_solver, *problem, start=start, delta=0.01,
+                                                  max_residual=config.ranging.warm_residual)
+        else:
+            (coord,cond,info) = self.server.solve(with_info, self.solver, *problem, delta=0.01, **self.solver_args())
+        info['cond_est'] = cond
+        return (coord,info)
+
+    def prepare(self):
+        return None
+
+    def solver_args(self):
+        return {}
+
+    def complete(self):
         self.finish()
 
-    def ranging_expire(self):
-        log.debug('Lateration::ranging_expire @ {}'.format(time.time() - self.start_time))
+    def trigger(self,reason):
+        with self.server.sessions.lock:
+            if self.laterating or not self.active:
+                return
+            self.laterating = True
+            older = self.leave_pending()
+        # Older sessions of the same tag go first to keep positions in order
+        for rng in older:
+            rng.trigger('flush')
+        log.debug('Lateration::trigger {} @ {}'.format(reason, clock() - self.start_time))
         self.ranging_timer.unarm()
+        self.quorum_timer.unarm()
         self.timeout_timer.unarm()
-        self.thread = threading.Thread(target=self.laterate);
-        self.thread.start()
+        if self.device:
+            self.device.update_history(self.reported)
+        self.server.sessions.laterated(self,reason)
+        self.thread = self.server.run_lateration(self)
+
+    def ranging_expire(self):
+        self.trigger('timer')
+
+    def quorum_expire(self):
+        if len(self.reported) >= config.ranging.quorum_min:
+            self.trigger('quorum')
 
     def timeout_expire(self):
-        log.debug('Lateration::timeout_expire @ {}'.format(time.time() - self.start_time))
+        log.debug('Lateration::timeout_expire @ {}'.format(clock() - self.start_time))
+        self.server.sessions.timed_out(self)
         self.finish()
 
+    def add_times(self,phase,evnt):
+        if self.device:
+            self.server.windows.record(self.device, evnt.anchor, phase, evnt.recv - self.first, self.laterating)
+        early = False
+        with self.server.sessions.lock:
+            # Once triggered the solver owns the session data, late frames only count
+            if self.laterating or not self.active:
+                return
+            self.blinks[phase][evnt.anchor.key] = evnt
+            index = self.index.get(evnt.anchor.key)
+            if index is not None:
+                self.times[phase,index] = evnt.timestamp()
+                self.valid[phase,index] = True
+                if self.valid[0,index] and self.valid[1,index] and self.valid[2,index]:
+                    self.reported.add(evnt.anchor.key)
+                    if self.expect is not None:
+                        self.expect.discard(evnt.anchor.key)
+                        early = not self.expect and self.enough_anchors()
+        if early:
+            self.trigger('early')
+
+    def enough_anchors(self):
+        # The beacon and reference anchors do not yield ranges of their own
+        return len(self.reported) >= self.min_anchors + self.ref_anchors
+
+    def adapt_windows(self):
+        (self.window,timeout) = self.server.windows.get_windows(self.device)
+        self.timeout_timer.unarm()
+        self.timeout_timer.arm(when=self.first+timeout)
+
+    def expect_anchors(self):
+        # Anchors that recently reported for this tag and beacon
+        expect = self.device.expected_anchors()
+        if expect:
+            self.expect = expect - self.reported
+
+    def tdoa_ranges(self,ref):
+        T = self.times
+        L = woodoo_array((T[0], T[0,ref], T[1,ref], T[1], T[2], T[2,ref]))
+        V = np.all(self.valid,0) & np.all(self.valid[:,ref]) & np.isfinite(L)
+        V[ref] = False
+        return (L,V)
+
+    def log_ranges(self,L,D,V):
+        if log.isEnabledFor(logging.DEBUG):
+            for (i,anchor) in enumerate(self.geometry.anchors):
+                if V[i]:
+                    log.debug(' * Anchor: {} <{}> LAT:{:.3f} D:{:.3f}'.format(anchor.name,anchor.eui64,L[i],D[i]))
+                elif np.isfinite(D[i]):
+                    log.debug(' * Anchor: {} <{}> D:{:.3f} BAD TDOA'.format(anchor.name,anchor.eui64,D[i]))
+                else:
+                    log.debug(' * Anchor: {} <{}> NOT FOUND'.format(anchor.name,anchor.eui64))
+
     def find_beacon(self):
         beacons = {}
         for evnt in self.blinks[1].values():
@@ -85,26 +246,35 @@ class Lateration():
     def add_blink(self,evnt):
         if self.active and self.method:
             log.debug('Lateration::add_blink:    ANC:{} <{}> SRC:{} Rx:{:.1f}dBm'.format(evnt.anchor.name, evnt.anchor.eui64, evnt.frame.get_src_eui(), evnt.get_rx_level()))
-            self.blinks[0][evnt.anchor.key] = evnt
             if self.device is None:
                 self.device = self.server.get_device(evnt.frame.get_src_eui())
+                if self.device:
+                    self.device.pending.append(self)
+                    self.first = evnt.recv
+                    self.adapt_windows()
+                    self.expect_anchors()
+            self.add_times(0,evnt)
 
     def add_beacon(self,evnt):
         if self.active and self.method == self.ONE_WAY_RANGING:
             log.debug('Lateration::add_beacon:   ANC:{} <{}> SRC:{} Rx:{:.1f}dBm'.format(evnt.anchor.name, evnt.anchor.eui64, evnt.frame.get_src_eui(), evnt.get_rx_level()))
-            self.blinks[1][evnt.anchor.key] = evnt
-            src = evnt.frame.get_src_eui()
+            self.add_times(1,evnt)
 
     def add_request(self,evnt):
         if self.active and self.method == self.TWO_WAY_RANGING:
             log.debug('Lateration::add_request:  ANC:{} <{}> SRC:{} Rx:{:.1f}dBm'.format(evnt.anchor.name, evnt.anchor.eui64, evnt.frame.get_src_eui(), evnt.get_rx_level()))
-            self.blinks[1][evnt.anchor.key] = evnt
+            self.add_times(1,evnt)
 
     def add_response(self,evnt):
         if self.active and self.method:
             log.debug('Lateration::add_response: ANC:{} <{}> SRC:{} Rx:{:.1f}dBm'.format(evnt.anchor.name, evnt.anchor.eui64, evnt.frame.get_src_eui(), evnt.get_rx_level()))
-            self.blinks[2][evnt.anchor.key] = evnt
-            self.ranging_timer.arm()
+            self.add_times(2,evnt)
+            if not self.laterating:
+                if self.first is not None:
+                    self.ranging_timer.arm(when=self.first+self.window)
+                else:
+                    self.ranging_timer.arm()
+                self.quorum_timer.arm()
 
 
 
@@ -124,6 +294,14 @@ class OWR(Lateration):
         Lateration.__init__(self, server, rangid, Lateration.ONE_WAY_RANGING)
         self.beacon = None
 
+    def complete(self):
+        try:
+            self.select_beacon()
+            self.register_beacon(self.beacon)
+        except:
+            log.exception('{} beacon selection failed'.format(type(self).__name__))
+        self.finish()
+
     def register_beacon(self, beacon):
         if beacon and self.device:
             self.device.update_beacon(beacon)
@@ -185,169 +363,95 @@ class OWRExt(OWR):
 
 
 
-class LatWLS2D(OWR):
+class LatWLS(OWR):
 
-    def laterate(self):
-        if self.device:
-            try:
-                self.beacon = self.find_beacon()
-            
-                log.debug(' * Beacon: {} {} {}'.format(self.beacon.name, self.beacon.eui64, self.beacon.coord))
-        
-                bkey = self.beacon.key
-            
-                COORDS = []
-                RANGES = []
-                SIGMAS = []
-            
-                T = [ 0, 0, 0, 0, 0, 0 ]
-
-                for (akey,anchor) in self.server.anchors.items():
-                    if akey != bkey:
-                        try:
-                            T[0] = self.blinks[0][akey].timestamp()
-                            T[1] = self.blinks[0][bkey].timestamp()
-                            T[2] = self.blinks[1][bkey].timestamp()
-                            T[3] = self.blinks[1][akey].timestamp()
-                            T[4] = self.blinks[2][akey].timestamp()
-                            T[5] = self.blinks[2][bkey].timestamp()
-                            C = self.beacon.distance_to(anchor)
-                            L = woodoo(T)
-                            D = C - 2*L
-                            if -config.ranging.max_dist < D < config.ranging.max_dist:
-                                COORDS.append((anchor.coord[0],anchor.coord[1]))
-                                RANGES.append(D)
-                                SIGMAS.append(0.1)
-                                log.debug( ' * Anchor: {} <{}> LAT:{:.3f} C:{:.3f} D:{:.3f}'.format(anchor.name,anchor.eui64,L,C,D))
-                            else:
-                                log.debug( ' * Anchor: {} <{}> LAT:{:.3f} C:{:.3f} D:{:.3f} *** FAILURE'.format(anchor.name,anchor.eui64,L,C,D))
-                        except KeyError:
-                            log.debug( ' * Anchor: {} <{}> NOT FOUND'.format(anchor.name,anchor.eui64))
-                        except ZeroDivisionError:
-                            log.debug( ' * Anchor: {} <{}> BAD TIMES'.format(anchor.name,anchor.eui64))
-
-                if len(RANGES) > 1:
-                    (coord,cond) = hyperlater2D((self.beacon.coord[0], self.beacon.coord[1]), COORDS, RANGES, SIGMAS, delta=0.01)
-                    self.update(coord)
-        
-            except:
-                log.exception('LatWLS2D failed')
-        
-        self.select_beacon()
-        self.register_beacon(self.beacon)
+    dims = 2
+    min_anchors = 2
+    ref_anchors = 1
 
-        self.finish()
+    def select_reference(self):
+        return self.beacon
 
+    def owr_ranges(self,ridx):
+        bidx = self.index[self.beacon.key]
+        (L,V) = self.tdoa_ranges(ridx)
+        V[bidx] = False
+        C = self.geometry.dists[bidx]
+        D = (C - C[ridx]) - 2*L
+        V &= np.abs(D) < config.ranging.max_dist
+        self.log_ranges(L,D,V)
+        return (D,V)
 
-class LatWLS3D(OWR):
-    
-    def laterate(self):
+    def prepare(self):
         if self.device:
             try:
                 self.beacon = self.find_beacon()
-            
-                log.debug( ' * Beacon: {} <{}>'.format(self.beacon.name,self.beacon.eui64))
-                
-                bkey = self.beacon.key
-                
-                COORDS = []
-                RANGES = []
-                SIGMAS = []
-                
-                T = [ 0, 0, 0, 0, 0, 0 ]
-                
-                for (akey,anchor) in self.server.anchor_keys.items():
-                    if akey != bkey:
-                        try:
-                            T[0] = self.blinks[0][akey].timestamp()
-                            T[1] = self.blinks[0][bkey].timestamp()
-                            T[2] = self.blinks[1][bkey].timestamp()
-                            T[3] = self.blinks[1][akey].timestamp()
-                            T[4] = self.blinks[2][akey].timestamp()
-                            T[5] = self.blinks[2][bkey].timestamp()
-                            C = self.beacon.distance_to(anchor)
-                            L = woodoo(T)
-                            D = C - 2*L
-                            if -config.ranging.max_dist < D < config.ranging.max_dist:
-                                COORDS.append(anchor.coord)
-                                RANGES.append(D)
-                                SIGMAS.append(0.1)
-                                log.debug( ' * Anchor: {} <{}> LAT:{:.3f} C:{:.3f} D:{:.3f}'.format(anchor.name,anchor.eui64,L,C,D))
-                            else:
-                                log.debug( ' * Anchor: {} <{}> D:{:.3f} BAD TDOA'.format(anchor.name,anchor.eui64,D))
-                        except KeyError:
-                            log.debug( ' * Anchor: {} <{}> NOT FOUND'.format(anchor.name,anchor.eui64))
-                        except ZeroDivisionError:
-                            log.debug( ' * Anchor: {} <{}> BAD TIMES'.format(anchor.name,anchor.eui64))
-                            
-                if len(RANGES) > 4:
-                    (coord,cond) = hyperlater3D(self.beacon.coord, COORDS, RANGES, SIGMAS, delta=0.01)
-                    self.update(coord)
-                    
-            except:
-                log.exception('LatWLS3D failed')
-        
-        self.select_beacon()
-        self.register_beacon(self.beacon)
+                reference = self.select_reference()
 
-        self.finish()
+                log.debug(' * Beacon: {} <{}>'.format(self.beacon.name,self.beacon.eui64))
+                log.debug(' * Reference: {} <{}>'.format(reference.name,reference.eui64))
 
+                ridx = self.index[reference.key]
+                (D,V) = self.owr_ranges(ridx)
+                B = self.geometry.coords[:,0:self.dims]
+                N = np.count_nonzero(V)
+                self.used = np.flatnonzero(V)
+
+                if N >= self.min_anchors:
+                    return (B[ridx], B[V], D[V], np.full(N, 0.1))
 
-class LatSWLS(OWRExt):
-    
-    def laterate(self):
-        if self.device:
-            try:
-                self.beacon = self.find_beacon()
-                self.common = self.select_common()
-                
-                log.debug( ' * Beacon: {} <{}>'.format(self.beacon.name,self.beacon.eui64))
-                log.debug( ' * Common: {} <{}>'.format(self.common.name,self.common.eui64))
-                
-                ckey = self.common.key
-                bkey = self.beacon.key
-                
-                COORDS = []
-                RANGES = []
-                SIGMAS = []
-                
-                T = [ 0, 0, 0, 0, 0, 0 ]
-                
-                for (akey,anchor) in self.server.anchor_keys.items():
-                    if akey not in (bkey,ckey):
-                        try:
-                            T[0] = self.blinks[0][akey].timestamp()
-                            T[1] = self.blinks[0][ckey].timestamp()
-                            T[2] = self.blinks[1][ckey].timestamp()
-                            T[3] = self.blinks[1][akey].timestamp()
-                            T[4] = self.blinks[2][akey].timestamp()
-                            T[5] = self.blinks[2][ckey].timestamp()
-                            B = self.beacon.distance_to(self.common)
-                            C = self.beacon.distance_to(anchor)
-                            L = woodoo(T)
-                            D = (C - B) - 2*L
-                            if -config.ranging.max_dist < D < config.ranging.max_dist:
-                                COORDS.append(anchor.coord)
-                                RANGES.append(D)
-                                SIGMAS.append(0.1)
-                                log.debug( ' * Anchor: {} <{}> LAT:{:.3f} B:{:.3f} C:{:.3f} D:{:.3f}'.format(anchor.name,anchor.eui64,L,B,C,D))
-                            else:
-                                log.debug( ' * Anchor: {} <{}> D:{:.3f} BAD TDOA'.format(anchor.name,anchor.eui64,D))
-                        except KeyError:
-                            log.debug( ' * Anchor: {} <{}> NOT FOUND'.format(anchor.name,anchor.eui64))
-                        except ZeroDivisionError:
-                            log.debug( ' * Anchor: {} <{}> BAD TIMES'.format(anchor.name,anchor.eui64))
-                
-                if len(RANGES) > 4:
-                    (coord,cond) = hyperlater3D(self.beacon.coord, COORDS, RANGES, SIGMAS, delta=0.01)
-                    self.update(coord)
-                    
             except:
-                log.exception('LatSWLS failed')
-            
-        self.select_beacon()
-        self.register_beacon(self.beacon)
+                log.exception('{} failed'.format(type(self).__name__))
 
-        self.finish()
+        return None
+
+
+class LatWLS2D(LatWLS):
+
+    dims = 2
+    min_anchors = 3
+
+    solver = staticmethod(hyperlater2D)
+    warm_solver = staticmethod(gausslater2D)
+    batch_solver = staticmethod(hyperlater2D_batch)
+    ransac_solver = staticmethod(hyperransac2D)
+
+
+class LatWLS3D(LatWLS):
+
+    dims = 3
+    min_anchors = 5
+
+    solver = staticmethod(hyperlater3D)
+    warm_solver = staticmethod(gausslater3D)
+    batch_solver = staticmethod(hyperlater3D_batch)
+    ransac_solver = staticmethod(hyperransac3D)
+
+
+class LatWLS3Dp(LatWLS):
+
+    dims = 3
+    min_anchors = 4
+
+    solver = staticmethod(hyperlater3Dp)
+
+    def solver_args(self):
+        return { 'z_est': self.device.kwargs.get('z', config.ranging.z_est) }
+
+
+class LatSWLS(LatWLS,OWRExt):
+
+    dims = 3
+    min_anchors = 5
+    ref_anchors = 2
+
+    solver = staticmethod(hyperlater3D)
+    warm_solver = staticmethod(gausslater3D)
+    batch_solver = staticmethod(hyperlater3D_batch)
+    ransac_solver = staticmethod(hyperransac3D)
 
+    def select_reference(self):
+        # Ranges are relative to the common anchor rather than the beacon
+        self.common = self.select_common()
+        return self.common
 
@@ -4,6 +4,8 @@ import argparse
 
 from logger import *
 from server import *
+from shard import *
+from aserver import *
 from config import *
 
 
@@ -28,7 +30,12 @@ def main():
     logger.initLogger(args.logging)
 
     
-    server = Server()
+    if config.rtls.shards > 1:
+        server = ShardServer()
+    elif config.rtls.asyncio:
+        server = AsyncServer()
+    else:
+        server = Server()
 
     iprint('Tail RTLS daemon starting...')
 
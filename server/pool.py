@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+
+import time
+import queue
+import zlib
+import logger
+import threading
+import collections
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+from config import *
+
+
+log = logger.getLogger(__name__)
+
+
+class LaterationWorker(threading.Thread):
+
+    def __init__(self, pool, index):
+        threading.Thread.__init__(self, name=f'lateration-{index}', daemon=True)
+        self.pool  = pool
+        self.index = index
+        self.queue = queue.Queue()
+        self.busy  = 0.0
+        self.count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.batches = 0
+        self.start()
+
+    def submit(self, rng):
+        self.queue.put((time.time(),rng))
+
+    def stop(self):
+        self.queue.put(None)
+
+    def account(self, queued, start):
+        wait = start - queued
+        self.count += 1
+        self.wait_sum += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            (queued,rng) = item
+            start = time.time()
+            try:
+                rng.laterate()
+            except Exception:
+                log.exception(f'Lateration failed')
+            self.account(queued, start)
+            self.busy += time.time() - start
+
+
+class BatchWorker(LaterationWorker):
+
+    def __init__(self, pool, index, size):
+        self.size = size
+        LaterationWorker.__init__(self, pool, index)
+
+    def collect(self):
+        items = [ self.queue.get() ]
+        while items[-1] is not None and len(items) < self.size:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def solve(self, items):
+        groups = {}
+        for (queued,rng,problem) in items:
+            if problem is None:
+                continue
+            solver = rng.get_batch_solver()
+            if solver is None:
+                # RANSAC and warm start sessions take the per-session path
+                try:
+                    (coord,info) = rng.solve(problem)
+                    rng.update(coord,info)
+                except Exception:
+                    log.exception(f'Lateration failed')
+            else:
+                groups.setdefault(solver, []).append((rng,problem))
+        for (solver,group) in groups.items():
+            try:
+                info = []
+                (X,C) = solver([ problem for (rng,problem) in group ], delta=0.01, info=info)
+                # Non-finite fixes are suppressed by the quality check
+                for (k,(rng,problem)) in enumerate(group):
+                    info[k]['cond_est'] = C[k]
+                    rng.update(X[k],info[k])
+            except Exception:
+                log.exception(f'Batched lateration failed')
+
+    def run(self):
+        running = True
+        while running:
+            items = self.collect()
+            if items[-1] is None:
+                items.pop()
+                running = False
+            start = time.time()
+            batch = []
+            for (queued,rng) in items:
+                try:
+                    rng.server.sessions.record(rng)
+                    batch.append((queued,rng,rng.prepare()))
+                except Exception:
+                    log.exception(f'Lateration failed')
+                    batch.append((queued,rng,None))
+            self.solve(batch)
+            # Completion keeps the queue order, so tags are updated in order
+            for (queued,rng,problem) in batch:
+                try:
+                    rng.complete()
+                except Exception:
+                    log.exception(f'Lateration failed')
+            for (queued,rng,problem) in batch:
+                self.account(queued, start)
+            self.busy += time.time() - start
+            self.batches += 1
+
+
+class LaterationPool():
+
+    def __init__(self, workers, mode='thread', batch=256):
+        self.started = time.time()
+        self.solver  = None
+        self.mode    = mode
+        self.lock    = threading.Lock()
+        self.solves  = { 'solves':0, 'warm':0, 'iterations':0, 'rejected':0, 'suppressed':0, 'quality':0, 'gdop':0.0, 'rms':0.0 }
+        self.rejected = collections.Counter()
+        if mode == 'batch':
+            # A single batching worker keeps all tags in order
+            self.workers = [ BatchWorker(self,0,batch) ]
+            return
+        if mode == 'process':
+            if multiprocessing.current_process().daemon:
+                log.warning(f'Lateration process pool not available in a daemon process, using threads')
+                self.mode = 'thread'
+            else:
+                self.solver = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self.workers = [ LaterationWorker(self,i) for i in range(workers) ]
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        if self.solver:
+            self.solver.shutdown(wait=False)
+
+    def get_worker(self, rng):
+        # Sessions of one tag always run on the same worker to keep them in order
+        if rng.device is not None:
+            key = rng.device.eui64.encode()
+        else:
+            key = rng.rangid
+        return self.workers[zlib.crc32(key) % len(self.workers)]
+
+    def submit(self, rng):
+        worker = self.get_worker(rng)
+        worker.submit(rng)
+        return worker
+
+    def solve(self, func, *args, **kwargs):
+        if self.solver:
+            return self.solver.submit(func, *args, **kwargs).result()
+        return func(*args, **kwargs)
+
+    def record(self, info):
+        with self.lock:
+            self.solves['solves'] += 1
+            self.solves['warm'] += info.get('warm', 0)
+            self.solves['iterations'] += info.get('iter', 0)
+            self.solves['suppressed'] += info.get('suppressed', 0)
+            if np.isfinite(info.get('gdop', np.inf)) and np.isfinite(info.get('rms', np.inf)):
+                self.solves['quality'] += 1
+                self.solves['gdop'] += info['gdop']
+                self.solves['rms'] += info['rms']
+            for anchor in info.get('rejected', ()):
+                self.solves['rejected'] += 1
+                self.rejected[anchor.eui64] += 1
+
+    def get_stats(self):
+        elapsed = time.time() - self.started
+        count = sum(worker.count for worker in self.workers)
+        stats = {
+            'mode':        self.mode,
+            'workers':     len(self.workers),
+            'processed':   count,
+            'batches':     sum(worker.batches for worker in self.workers),
+            'depth':       [ worker.queue.qsize() for worker in self.workers ],
+            'utilisation': [ round(worker.busy / elapsed, 4) for worker in self.workers ],
+            'wait_avg':    sum(worker.wait_sum for worker in self.workers) / max(count, 1),
+            'wait_max':    max(worker.wait_max for worker in self.workers),
+        }
+        stats.update(self.get_solve_stats())
+        return stats
+
+    def get_solve_stats(self):
+        return {
+            'solves':      self.solves['solves'],
+            'warm':        self.solves['warm'],
+            'iter_avg':    self.solves['iterations'] / max(self.solves['solves'], 1),
+            'rejected':    self.solves['rejected'],
+            'suppressed':  self.solves['suppressed'],
+            'gdop_avg':    self.solves['gdop'] / max(self.solves['quality'], 1),
+            'rms_avg':     self.solves['rms'] / max(self.solves['quality'], 1),
+            'rejects':     dict(self.rejected),
+        }
@@ -5,6 +5,7 @@ import sys
 import time
 import sched
 import random
+import logging
 import threading
 import json
 import socket
@@ -15,9 +16,17 @@ import timer
 from config import *
 from anchor import *
 from mqrpc import *
+from rfmsg import *
 from event import *
 from wpan import *
 from tag import *
+from ingest import *
+from session import *
+from pool import *
+from window import *
+from tracker import *
+from beacon import *
+from supervisor import *
 
 import paho.mqtt.client as mqtt
 
@@ -29,17 +38,32 @@ log_msg = logger.getLogger('mesg')
 
 class Server():
 
-    def __init__(self):
+    def __init__(self, shard=None):
 
         WPANFrame.verbose = config.dw1000.verbose
 
+        self.shard = shard
         self.rpcid = config.rtls.mqrpc_id
         self.domain = config.rtls.mqtt_domain
+
+        # Only the first shard supervises anchors and registers beacons
+        self.controller = None
+        if self.shard is not None:
+            self.rpcid = f'{self.rpcid}-{self.shard}'
+            if self.shard > 0:
+                self.controller = f'{config.rtls.mqrpc_id}-0'
         
         self.tags     = {}
         self.anchors  = {}
-        self.rangings = {}
-        self.timers   = timer.TimerThread()
+        self.geometry = AnchorGeometry()
+        self.stats    = {}
+        self.timers   = self.init_timers()
+        self.windows  = WindowManager()
+        self.tracker  = Tracker() if config.coord.tracker else None
+        self.sessions = SessionManager(self)
+        self.beacons  = BeaconReconciler(self) if self.controller is None else RemoteBeacons(self, self.controller)
+        self.pool     = self.init_pool()
+        self.rfstats  = { 'received':0, 'ignored':0, 'unknown':0 }
 
         self.mqtt     = mqtt.Client()
         
@@ -53,12 +77,41 @@ class Server():
         #self.mqtt.on_subscribe    = self.mqtt_on_subscribe
         #self.mqtt.on_unsubscribe  = self.mqtt_on_unsubscribe
 
-        self.mqtt.connect(config.rtls.mqtt_host, config.rtls.mqtt_port)
+        self.mqtt_connect()
 
-        self.mqtt.subscribe(f'TAIL/RF/{self.domain}/#', 0)
-        self.mqtt.message_callback_add(f'TAIL/RF/{self.domain}/#', self.mqtt_on_rf_message)
+        # Sharded workers receive their RF messages from the front process
+        if self.shard is None:
+            self.mqtt.subscribe(f'TAIL/RF/{self.domain}/#', 0)
+            self.mqtt.message_callback_add(f'TAIL/RF/{self.domain}/#', self.mqtt_on_rf_message)
         
         self.rpc = MQRPC(self.mqtt, self.rpcid, 5)
+        self.rpc.register('GETSTATS', self.rpc_get_stats)
+        self.rpc.register('GETRPCSTATS', self.rpc.rpc_get_rpc_stats)
+        self.rpc.register('GETDTATTR', self.rpc_get_dtattr)
+        self.rpc.register('GETDWATTR', self.rpc_get_dwattr)
+        self.rpc.register('SETDWATTR', self.rpc_set_dwattr)
+        self.rpc.register('GETDWCONFIG', self.rpc_get_dwconfig)
+        self.rpc.register('FLUSHATTRS', self.rpc_flush_attrs)
+
+        if self.controller is None:
+            self.supervisor = AnchorSupervisor(self)
+            self.rpc.register('GETLIVENESS', self.supervisor.rpc_get_liveness)
+            self.rpc.register('ASSIGNBEACON', self.rpc_assign_beacon)
+        else:
+            self.supervisor = LivenessFollower(self, self.controller)
+
+        self.add_stats('rf', self.get_rf_stats)
+        self.add_stats('timers', self.timers.get_stats)
+        self.add_stats('sessions', self.sessions.get_stats)
+        self.add_stats('beacons', self.beacons.get_stats)
+        self.add_stats('anchors', self.supervisor.get_stats)
+        self.add_stats('rpc', self.rpc.get_stats)
+        self.add_stats('attrs', self.get_attr_stats)
+        self.add_stats('windows', self.windows.get_stats)
+        self.add_stats('lateration', self.pool.get_stats)
+
+        if self.tracker is not None:
+            self.add_stats('tracker', self.tracker.get_stats)
 
         for arg in config.anchors:
             self.add_anchor(arg)
@@ -66,16 +119,54 @@ class Server():
         for arg in config.tags:
             self.add_tag(arg)
 
+        self.start_supervisor()
+
+        self.ingest = None
+
+        if config.ingest.queue_len > 0:
+            self.ingest = self.init_ingest()
+            self.add_stats('ingest', self.ingest.get_stats)
+
+
+    def init_timers(self):
+        return timer.TimerThread(config.rtls.timer_tolerance)
+
+    def init_pool(self):
+        return LaterationPool(config.ranging.workers, config.ranging.worker_mode, config.ranging.batch_size)
+
+    def init_ingest(self):
+        return IngestQueue(self, config.ingest.queue_len, config.ingest.policy)
+
+    def mqtt_connect(self):
+        self.mqtt.connect(config.rtls.mqtt_host, config.rtls.mqtt_port)
+
 
     def run(self):
         log.debug(f'starting server')
         self.mqtt.loop_forever()
 
+    def run_shard(self, queue):
+        log.debug(f'starting server shard {self.shard}')
+        self.mqtt.loop_start()
+        while True:
+            args = queue.get()
+            if args is None:
+                break
+            try:
+                self.recv_rf_msg(**args)
+            except Exception:
+                log.exception(f'Unable to handle RF message from {args.get("ANCHOR")}')
+        self.mqtt.loop_stop()
+
     def stop(self):
         log.debug(f'stopping server')
-        for anchor in self.anchors.values():
-            anchor.stop()
+        self.supervisor.stop()
+        if self.ingest:
+            self.ingest.stop()
         self.rpc.close()
+        self.beacons.stop()
+        self.sessions.stop()
+        self.pool.stop()
         self.timers.stop()
         self.mqtt.disconnect()
 
@@ -84,10 +175,19 @@ class Server():
         log.debug(f'Server::add_anchor {args}')
         dev = Anchor(self, **args)
         self.anchors[dev.eui64] = dev
+        self.update_anchor_geometry()
+
+    def start_supervisor(self):
+        self.supervisor.start()
 
     def rem_anchor(self, dev):
         log.debug(f'Server::rem_anchor {dev.eui64}')
         self.anchors.pop(dev.eui64, None)
+        self.update_anchor_geometry()
+
+    def update_anchor_geometry(self):
+        # Sessions keep the geometry they started with; new ones see the swap
+        self.geometry = AnchorGeometry(self.anchors.values())
 
     def get_anchor(self, key):
         return self.anchors[key]
@@ -118,6 +218,11 @@ class Server():
                 return tag
         return None
 
+    def rpc_assign_beacon(self, TAG, BEACON=None):
+        tag = self.get_tag(TAG)
+        beacon = self.get_anchor(BEACON) if BEACON else None
+        self.beacons.assign(tag, beacon)
+
 
     def get_device(self, key):
         if key in self.anchors:
@@ -127,52 +232,145 @@ class Server():
         return None
 
 
+    def add_stats(self, name, func):
+        self.stats[name] = func
+
+    def get_stats(self, name=None):
+        if name is not None:
+            return self.stats[name]()
+        return { key:func() for (key,func) in self.stats.items() }
+
+    def rpc_get_stats(self, NAME=None):
+        return self.get_stats(NAME)
+
+
+    ## Anchor attributes are served from the per-anchor cache.
+    ## The handlers return futures, so misses do not block the MQTT thread.
+
+    def rpc_anchor(self, ANCHOR):
+        anchor = self.anchors.get(ANCHOR) or self.get_anchor_by_name(ANCHOR)
+        if anchor is None:
+            raise KeyError(f'Unknown anchor {ANCHOR}')
+        return anchor
+
+    def rpc_get_dtattr(self, ANCHOR, ATTR, FORMAT):
+        return self.rpc_anchor(ANCHOR).get_dtattr_async(ATTR, FORMAT)
+
+    def rpc_get_dwattr(self, ANCHOR, ATTR):
+        return self.rpc_anchor(ANCHOR).get_dwattr_async(ATTR)
+
+    def rpc_set_dwattr(self, ANCHOR, ATTR, VALUE):
+        return self.rpc_anchor(ANCHOR).set_dwattr_async(ATTR, VALUE)
+
+    def rpc_get_dwconfig(self, ANCHOR):
+        return self.rpc_anchor(ANCHOR).get_dwconfig_async()
+
+    def rpc_flush_attrs(self, ANCHOR=None):
+        anchors = self.anchors.values() if ANCHOR is None else [ self.rpc_anchor(ANCHOR) ]
+        for anchor in anchors:
+            anchor.flush_attrs()
+        return len(anchors)
+
+    def get_attr_stats(self):
+        stats = { 'hits':0, 'misses':0, 'anchors':{} }
+        for anchor in self.anchors.values():
+            entry = anchor.attrs.get_stats()
+            stats['hits'] += entry['hits']
+            stats['misses'] += entry['misses']
+            stats['anchors'][anchor.name] = entry
+        return stats
+
+
     def get_lat_algo(self, ref):
         algo = config.ranging.algorithm
         if algo == 'wls2d' or algo == 'wls':
             return LatWLS2D(self, ref)
         elif algo == 'wls3d':
-            return LatWLS2D(self, ref)
+            return LatWLS3D(self, ref)
+        elif algo == 'wls3dp':
+            return LatWLS3Dp(self, ref)
         elif algo == 'swls':
             return LatSWLS(self, ref)
         else:
             raise NotImplementedError
 
 
+    def run_lateration(self, rng):
+        return self.pool.submit(rng)
+
+    def solve(self, func, *args, **kwargs):
+        return self.pool.solve(func, *args, **kwargs)
+
+    def solver_stats(self, info):
+        self.pool.record(info)
+
     def get_ranging(self, evnt):
         ref = evnt.get_ranging_ref()
-        if ref not in self.rangings:
-            self.rangings[ref] = self.get_lat_algo(ref)
-            self.rangings[ref].start()
-        return self.rangings[ref]
+        rng = self.sessions.get(ref)
+        if rng is None and not self.sessions.late(ref, evnt):
+            # Frames ahead of their blink are parked until the session opens
+            self.sessions.add_orphan(ref, evnt)
+        return rng
 
     def finish_ranging(self, rng):
-        if rng.rangid in self.rangings:
-            del self.rangings[rng.rangid]
+        self.sessions.close(rng)
     
 
     def recv_tag_blink(self, evnt):
-        rng = self.get_ranging(evnt)
+        ref = evnt.get_ranging_ref()
+        rng = self.sessions.open(ref)
+        if rng is None:
+            return
         rng.add_blink(evnt)
+        for orph in self.sessions.claim_orphans(ref):
+            self.recv_rf_event(orph)
     
     def recv_anchor_beacon(self, evnt):
         rng = self.get_ranging(evnt)
-        rng.add_beacon(evnt)
+        if rng:
+            rng.add_beacon(evnt)
         
     def recv_ranging_req(self, evnt):
         rng = self.get_ranging(evnt)
-        rng.add_request(evnt)
+        if rng:
+            rng.add_request(evnt)
     
     def recv_ranging_resp(self, evnt):
         rng = self.get_ranging(evnt)
-        rng.add_response(evnt)
+        if rng:
+            rng.add_response(evnt)
     
+    def get_rf_stats(self):
+        return dict(self.rfstats)
+
+    def accept_rf_event(self, evt):
+        frm = evt.frame
+        if frm.tail_protocol != frm.TAIL_PROTO_STD:
+            return False
+        if frm.tail_frmtype in (frm.FRAME_CONFIG_REQUEST, frm.FRAME_CONFIG_RESPONSE):
+            return False
+        if frm.tail_frmtype in (frm.FRAME_TAG_BLINK, frm.FRAME_RANGING_RESPONSE):
+            if frm.get_src_eui() not in self.tags:
+                self.rfstats['unknown'] += 1
+                return False
+        return True
+
     def recv_rf_msg(self, ANCHOR, DIR, TIMES, FRAME, FINFO):
         dev = self.get_anchor(ANCHOR)
-        evt = RFEvent(dev,DIR,TIMES,FRAME,FINFO)
+        evt = RFEvent(dev,DIR,TIMES,FRAME,FINFO,lazy=config.rtls.lazy_decode)
+        self.rfstats['received'] += 1
+        if not self.accept_rf_event(evt):
+            self.rfstats['ignored'] += 1
+        elif self.ingest:
+            self.ingest.put(evt)
+        else:
+            self.recv_rf_event(evt)
+
+    def recv_rf_event(self, evt):
         frm = evt.frame
         if frm.tail_protocol == frm.TAIL_PROTO_STD:
-            log_msg.debug(f'{ANCHOR} <{DIR}> {frm}')
+            if log_msg.isEnabledFor(logging.DEBUG):
+                log_msg.debug(f'{evt.key} <{evt.direct}> {frm}')
             if frm.tail_frmtype == frm.FRAME_TAG_BLINK:
                 self.recv_tag_blink(evt)
             elif frm.tail_frmtype == frm.FRAME_ANCHOR_BEACON:
@@ -189,10 +387,16 @@ class Server():
                 raise NotImplementedError(f'Tail WPAN frame type {frm.tail_frmtype} not implemented')
 
     
+    def recv_rf_payload(self, payload):
+        for args in decode_rf_msgs(payload):
+            try:
+                self.recv_rf_msg(**args)
+            except Exception:
+                log.exception(f'Unable to handle RF message from {args.get("ANCHOR")}')
+
     def mqtt_on_rf_message(self, client, userdata, msg):
         try:
-            args = json.loads(msg.payload.decode())
-            self.recv_rf_msg(**args)
+            self.recv_rf_payload(msg.payload)
         except Exception:
             log.exception(f'Unable to handle RF message {msg.payload}')
 
@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+
+import time
+import json
+import logger
+import threading
+import collections
+
+from timer import *
+from config import *
+
+
+log = logger.getLogger(__name__)
+
+
+class TimingWheel():
+
+    def __init__(self, tick, slots):
+        self.tick  = tick
+        self.slots = [ set() for i in range(slots) ]
+        self.where = {}
+        self.index = int(clock() / tick)
+
+    def Timer(self, delay, func, **args):
+        return Timer(self,delay,func,**args)
+
+    def arm(self, timer):
+        index = max(int(timer.expiry / self.tick) + 1, self.index + 1)
+        slot = self.slots[index % len(self.slots)]
+        slot.add(timer)
+        self.where[timer] = slot
+
+    def unarm(self, timer):
+        slot = self.where.pop(timer, None)
+        if slot is not None:
+            slot.discard(timer)
+
+    def advance(self, now):
+        expired = []
+        final = int(now / self.tick)
+        steps = min(final - self.index, len(self.slots))
+        for i in range(steps):
+            self.index += 1
+            slot = self.slots[self.index % len(self.slots)]
+            for timer in list(slot):
+                # Timers further than one revolution away stay in their slot
+                if timer.expiry <= now:
+                    slot.discard(timer)
+                    del self.where[timer]
+                    expired.append(timer)
+        self.index = final
+        expired.sort(key=lambda tm: tm.expiry)
+        return expired
+
+
+class SessionManager():
+
+    def __init__(self, server):
+        self.server   = server
+        self.capacity = config.ranging.sessions
+        self.maxorph  = config.ranging.orphans
+        self.orphttl  = config.ranging.timeout_timer
+        self.lock     = threading.RLock()
+        self.sessions = collections.OrderedDict()
+        self.orphans  = collections.OrderedDict()
+        self.closed   = collections.OrderedDict()
+        self.wheel    = TimingWheel(config.ranging.session_tick, config.ranging.session_slots)
+        self.timer    = PeriodicTimer(server.timers, config.ranging.session_tick, self.tick)
+        self.stats    = {
+            'opened':       0,
+            'completed':    0,
+            'early':        0,
+            'quorum':       0,
+            'timed_out':    0,
+            'evicted':      0,
+            'dropped':      0,
+            'orphans':      0,
+            'claimed':      0,
+            'expired':      0,
+            'late':         0,
+        }
+        self.age_sum  = 0.0
+        self.age_max  = 0.0
+        self.recorder = None
+        if config.ranging.record:
+            self.recorder = open(config.ranging.record, 'a')
+        self.timer.arm()
+
+    def Timer(self, delay, func, **args):
+        return Timer(self,delay,func,**args)
+
+    def arm(self, timer):
+        with self.lock:
+            self.wheel.arm(timer)
+
+    def unarm(self, timer):
+        with self.lock:
+            self.wheel.unarm(timer)
+
+    def tick(self):
+        now = clock()
+        with self.lock:
+            expired = self.wheel.advance(now)
+            while self.orphans:
+                (ref,(when,evnts)) = next(iter(self.orphans.items()))
+                if now - when < self.orphttl:
+                    break
+                self.orphans.popitem(last=False)
+                self.stats['expired'] += len(evnts)
+        # Callbacks may close sessions or start laterations
+        for timer in expired:
+            timer.expire()
+
+    def stop(self):
+        self.timer.unarm()
+        if self.recorder:
+            self.recorder.close()
+
+    def record(self, rng):
+        # Raw session data for offline solver comparisons
+        if self.recorder and rng.device:
+            data = {
+                'tag':     rng.device.eui64,
+                'beacon':  rng.find_beacon().eui64 if rng.blinks[1] else None,
+                'anchors': [ anchor.eui64 for anchor in rng.geometry.anchors ],
+                'coords':  rng.geometry.coords.tolist(),
+                'times':   rng.times.tolist(),
+                'valid':   rng.valid.tolist(),
+            }
+            with self.lock:
+                self.recorder.write(json.dumps(data) + '\n')
+
+
+    def get(self, ref):
+        with self.lock:
+            rng = self.sessions.get(ref)
+            if rng is not None:
+                self.sessions.move_to_end(ref)
+            return rng
+
+    def open(self, ref):
+        with self.lock:
+            rng = self.sessions.get(ref)
+            if rng is not None:
+                self.sessions.move_to_end(ref)
+                return rng
+            if len(self.sessions) >= self.capacity and not self.evict():
+                # Every session is laterating, the new one is dropped to hold the capacity
+                log.debug(f'SessionManager::open {ref.hex()} dropped, {len(self.sessions)} sessions laterating')
+                self.stats['dropped'] += 1
+                return None
+            rng = self.server.get_lat_algo(ref)
+            self.sessions[ref] = rng
+            self.stats['opened'] += 1
+            rng.start()
+            return rng
+
+    def close(self, rng):
+        with self.lock:
+            if self.sessions.get(rng.rangid) is rng:
+                del self.sessions[rng.rangid]
+                # Remembered so that stragglers are not parked as orphans
+                self.closed[rng.rangid] = (rng.device,rng.first)
+                if len(self.closed) > self.capacity:
+                    self.closed.popitem(last=False)
+
+    def late(self, ref, evnt):
+        with self.lock:
+            if ref not in self.closed:
+                return False
+            self.stats['late'] += 1
+            (device,first) = self.closed[ref]
+        if device and first is not None and evnt.frame.tail_frmtype == evnt.frame.FRAME_RANGING_RESPONSE:
+            self.server.windows.record(device, evnt.anchor, 2, evnt.recv - first, True)
+        return True
+
+    def evict(self):
+        # Sessions already handed over to lateration are left alone
+        for (ref,rng) in self.sessions.items():
+            if rng.thread is None:
+                log.debug(f'SessionManager::evict {ref.hex()}')
+                self.stats['evicted'] += 1
+                rng.finish()
+                return True
+        return False
+
+    def laterated(self, rng, reason=None):
+        age = clock() - rng.start_time
+        with self.lock:
+            self.stats['completed'] += 1
+            if reason in ('early','quorum'):
+                self.stats[reason] += 1
+            self.age_sum += age
+            self.age_max = max(self.age_max, age)
+
+    def timed_out(self, rng):
+        with self.lock:
+            self.stats['timed_out'] += 1
+
+
+    def add_orphan(self, ref, evnt):
+        with self.lock:
+            if ref in self.orphans:
+                self.orphans[ref][1].append(evnt)
+            else:
+                if len(self.orphans) >= self.maxorph:
+                    (_,(_,evnts)) = self.orphans.popitem(last=False)
+                    self.stats['expired'] += len(evnts)
+                self.orphans[ref] = (clock(), [ evnt ])
+            self.stats['orphans'] += 1
+
+    def claim_orphans(self, ref):
+        with self.lock:
+            (when,evnts) = self.orphans.pop(ref, (None,[]))
+            self.stats['claimed'] += len(evnts)
+            return evnts
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['active']  = len(self.sessions)
+            stats['pending'] = len(self.orphans)
+            stats['age_max'] = self.age_max
+            stats['age_avg'] = self.age_sum / max(self.stats['completed'], 1)
+        return stats
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+
+import zlib
+import time
+import queue
+import logger
+import collections
+import multiprocessing
+
+from config import *
+from mqrpc import *
+from rfmsg import *
+from event import *
+from wpan import *
+from server import *
+
+import paho.mqtt.client as mqtt
+
+
+log = logger.getLogger(__name__)
+
+
+def shard_worker(index, queue):
+    server = Server(shard=index)
+    try:
+        server.run_shard(queue)
+    finally:
+        server.stop()
+
+
+class ShardServer():
+
+    def __init__(self):
+
+        WPANFrame.verbose = config.dw1000.verbose
+
+        self.rpcid  = config.rtls.mqrpc_id
+        self.domain = config.rtls.mqtt_domain
+        self.count  = config.rtls.shards
+        self.key    = config.rtls.shard_key
+        self.refs   = collections.OrderedDict()
+        self.maxrefs = config.rtls.shard_refs
+        self.parked  = collections.OrderedDict()
+        self.park    = config.rtls.shard_park
+
+        self.routed  = [ 0 ] * self.count
+        self.dropped = [ 0 ] * self.count
+        self.ignored = 0
+        self.expired = 0
+
+        # Workers inherit the loaded config and logging, so they must be forked,
+        # and before any MQTT or timer threads exist here
+        context = multiprocessing.get_context('fork')
+        self.queues  = [ context.Queue(config.rtls.shard_queue) for i in range(self.count) ]
+        self.workers = [ context.Process(target=shard_worker, args=(i,self.queues[i]), daemon=True) for i in range(self.count) ]
+
+        for worker in self.workers:
+            worker.start()
+
+        self.mqtt = mqtt.Client()
+
+        self.mqtt.enable_logger(logger.getLogger('mqtt'))
+
+        self.mqtt.connect(config.rtls.mqtt_host, config.rtls.mqtt_port)
+
+        self.mqtt.subscribe(f'TAIL/RF/{self.domain}/#', 0)
+        self.mqtt.message_callback_add(f'TAIL/RF/{self.domain}/#', self.mqtt_on_rf_message)
+
+        self.rpc = MQRPC(self.mqtt, self.rpcid, 5)
+        self.rpc.register('GETSTATS', self.rpc_get_stats)
+
+
+    def run(self):
+        log.debug(f'starting shard server with {self.count} shards')
+        self.mqtt.loop_forever()
+
+    def stop(self):
+        log.debug(f'stopping shard server')
+        for que in self.queues:
+            try:
+                que.put_nowait(None)
+            except queue.Full:
+                pass
+        for worker in self.workers:
+            worker.join(5)
+        self.rpc.close()
+        self.mqtt.disconnect()
+
+
+    def hash_shard(self, key):
+        return zlib.crc32(key) % self.count
+
+    def remember_ref(self, ref, index):
+        self.refs[ref] = index
+        if len(self.refs) > self.maxrefs:
+            self.refs.popitem(last=False)
+
+    def park_msg(self, ref, args):
+        if ref not in self.parked:
+            self.parked[ref] = (time.monotonic(), [])
+            if len(self.parked) > self.maxrefs:
+                self.expired += len(self.parked.popitem(last=False)[1][1])
+        self.parked[ref][1].append(args)
+
+    def expire_parked(self):
+        limit = time.monotonic() - self.park
+        while self.parked:
+            (ref,(when,msgs)) = next(iter(self.parked.items()))
+            if when > limit:
+                break
+            del self.parked[ref]
+            self.expired += len(msgs)
+            log.debug(f'Shard router: no blink for ranging ref {ref.hex()}, {len(msgs)} messages dropped')
+
+    def route_rf_msg(self, args):
+        frame = TailWPANFrame(args['FRAME'],lazy=True)
+        ref = frame_ranging_ref(frame)
+        if ref is None:
+            self.ignored += 1
+            return
+        self.expire_parked()
+        if self.key == 'tag':
+            if frame.tail_frmtype in (frame.FRAME_TAG_BLINK, frame.FRAME_RANGING_RESPONSE):
+                index = self.hash_shard(frame.src_addr)
+                self.remember_ref(ref, index)
+                self.queue_rf_msg(index, args)
+                for parked in self.parked.pop(ref, (None,()))[1]:
+                    self.queue_rf_msg(index, parked)
+                return
+            # Beacons only carry the ranging reference, so they wait for its blink
+            if ref not in self.refs:
+                self.park_msg(ref, args)
+                return
+            index = self.refs[ref]
+        else:
+            index = self.hash_shard(ref)
+        self.queue_rf_msg(index, args)
+
+    def queue_rf_msg(self, index, args):
+        try:
+            self.queues[index].put_nowait(args)
+            self.routed[index] += 1
+        except queue.Full:
+            self.dropped[index] += 1
+            log.warning(f'Shard {index} queue full, RF message dropped')
+
+    def recv_rf_payload(self, payload):
+        for args in decode_rf_msgs(payload):
+            try:
+                self.route_rf_msg(args)
+            except Exception:
+                log.exception(f'Unable to route RF message from {args.get("ANCHOR")}')
+
+    def mqtt_on_rf_message(self, client, userdata, msg):
+        try:
+            self.recv_rf_payload(msg.payload)
+        except Exception:
+            log.exception(f'Unable to handle RF message {msg.payload}')
+
+
+    def get_shard_stats(self):
+        return {
+            'shards':   [ { 'depth':   self.queues[i].qsize(),
+                            'routed':  self.routed[i],
+                            'dropped': self.dropped[i],
+                            'alive':   self.workers[i].is_alive(), } for i in range(self.count) ],
+            'ignored':  self.ignored,
+            'parked':   sum(len(msgs) for (when,msgs) in self.parked.values()),
+            'expired':  self.expired,
+        }
+
+    def get_stats(self, name=None):
+        stats = { 'shard': self.get_shard_stats }
+        if name is not None:
+            return stats[name]()
+        return { key:func() for (key,func) in stats.items() }
+
+    def rpc_get_stats(self, NAME=None):
+        return self.get_stats(NAME)
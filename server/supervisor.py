@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+import time
+import logger
+import threading
+import functools
+import concurrent.futures
+
+from config import *
+from mqrpc import RemoteError
+
+
+log = logger.getLogger(__name__)
+
+
+class Liveness():
+
+    def __init__(self):
+        self.pings   = 0
+        self.replies = 0
+        self.misses  = 0
+        self.rtt     = None
+        self.rtt_avg = None
+        self.seen    = None
+
+
+class AnchorSupervisor():
+
+    def __init__(self, server):
+        self.server   = server
+        self.interval = config.supervisor.interval
+        self.misses   = config.supervisor.misses
+        self.lock     = threading.Lock()
+        self.table    = {}
+        self.rounds   = 0
+        self.exit     = threading.Event()
+        self.thread   = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='supervisor', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.exit.set()
+
+    def run(self):
+        while not self.exit.is_set():
+            # The poll waits for the replies, which counts towards the interval
+            start = time.monotonic()
+            try:
+                self.poll()
+            except Exception:
+                log.exception(f'Anchor supervision failed')
+            self.exit.wait(max(0, self.interval - (time.monotonic() - start)))
+
+    def reply(self, key, sent, future):
+        if future.exception() is None:
+            rtt = time.monotonic() - sent
+            with self.lock:
+                entry = self.table[key]
+                entry.replies += 1
+                entry.rtt = rtt
+                entry.rtt_avg = rtt if entry.rtt_avg is None else 0.8*entry.rtt_avg + 0.2*rtt
+                entry.seen = time.time()
+
+    def poll(self):
+        # One PING to every anchor per round, all under the same deadline
+        anchors = list(self.server.anchors.values())
+        with self.lock:
+            self.rounds += 1
+            for anchor in anchors:
+                self.table.setdefault(anchor.key, Liveness()).pings += 1
+            for key in set(self.table) - { anchor.key for anchor in anchors }:
+                del self.table[key]
+        sent = time.monotonic()
+        calls = self.server.rpc.multicall_async([ anchor.eui64 for anchor in anchors ], 'PING')
+        for anchor in anchors:
+            calls[anchor.eui64].add_done_callback(functools.partial(self.reply, anchor.key, sent))
+        concurrent.futures.wait(calls.values())
+        for anchor in anchors:
+            alive = calls[anchor.eui64].exception() is None
+            with self.lock:
+                entry = self.table[anchor.key]
+                if alive:
+                    entry.misses = 0
+                else:
+                    entry.misses += 1
+                misses = entry.misses
+            if alive and not anchor.active:
+                anchor.activate()
+            elif not alive and anchor.active and misses >= self.misses:
+                anchor.deactivate()
+
+    def rpc_get_liveness(self):
+        return { anchor.eui64: anchor.active for anchor in self.server.anchors.values() }
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'rounds':  self.rounds,
+                'anchors': { anchor.name: { 'active':  anchor.active,
+                                            'pings':   entry.pings,
+                                            'replies': entry.replies,
+                                            'misses':  entry.misses,
+                                            'rtt':     entry.rtt,
+                                            'rtt_avg': entry.rtt_avg,
+                                            'seen':    entry.seen, }
+                             for anchor in self.server.anchors.values()
+                             for entry in [ self.table.get(anchor.key) ] if entry is not None },
+            }
+
+
+class LivenessFollower(AnchorSupervisor):
+
+    # Shards other than the controller copy its view instead of pinging
+    # the anchors, so that only one RESET is ever sent per activation.
+
+    def __init__(self, server, controller):
+        AnchorSupervisor.__init__(self, server)
+        self.controller = controller
+        self.failed     = 0
+
+    def poll(self):
+        with self.lock:
+            self.rounds += 1
+        try:
+            liveness = self.server.rpc.call(self.controller, 'GETLIVENESS')
+        except (TimeoutError, ConnectionError, RemoteError):
+            with self.lock:
+                self.failed += 1
+            return
+        for (eui64,active) in liveness.items():
+            anchor = self.server.anchors.get(eui64)
+            if anchor is not None:
+                anchor.active = active
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'rounds':     self.rounds,
+                'failed':     self.failed,
+                'controller': self.controller,
+                'active':     [ anchor.name for anchor in self.server.anchors.values() if anchor.active ],
+            }
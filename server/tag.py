@@ -4,7 +4,9 @@ import os
 import sys
 
 import math
+import time
 import logger
+import collections
 
 from tail import *
 from wpan import *
@@ -26,31 +28,73 @@ class Tag(Tail):
         self.server  = server
         self.kwargs  = kwargs
         self.beacon  = None
+        self.priority = kwargs.get('priority', 0)
 
         self.coord   = Coord(None)
+        self.updated = None
+        self.history = {}
+        self.pending = []
 
-        # Different filter designs could be chosen here
-        self.filter  = CoordQCFilter( CoordGeoFilter(config.coord.filter_len),
-                                      CoordGeoFilter(config.coord.qc_filter_len),
-                                      config.coord.qc_filter_dev )
+        # The shared Kalman tracker replaces the per-tag filters when enabled
+        self.tracker = server.tracker
+        self.filter  = None
+        if self.tracker is None:
+            self.filter = CoordQCFilter( CoordGeoFilter(config.coord.filter_len),
+                                         CoordGeoFilter(config.coord.qc_filter_len),
+                                         config.coord.qc_filter_dev )
 
 
     def report_coord(self):
         topic = 'TAIL/TAG/{}/{}/COORD'.format(self.server.domain, self.eui64)
         self.server.mqtt_publish(topic, TAG=self.eui64, NAME=self.name,
-                                 COORD=self.coord.tolist(), FILTERED=self.filter.tolist())
-    
-    def update_coord(self, new_coord):
+                                 COORD=self.coord.tolist(), FILTERED=self.filtered(self.updated).tolist())
+
+    def filtered(self, now=None):
+        if self.tracker is not None:
+            return self.tracker.position(self.key, now)
+        return self.filter.value()
+
+    def update_coord(self, new_coord, noise=None):
         log.debug(f'Tag: COORD: {new_coord.tolist()}')
         self.coord.update(new_coord)
-        self.filter.update(new_coord)
+        self.updated = time.time()
+        if self.tracker is not None:
+            self.tracker.update(self.key, new_coord, noise, self.updated)
+        else:
+            self.filter.update(new_coord)
         self.report_coord()
 
+    def recent_coord(self, age):
+        if self.updated is not None and time.time() - self.updated < age:
+            return self.filtered()
+        return None
+
+    def beacon_key(self):
+        if self.beacon:
+            return self.beacon.key
+        return None
+
+    def expected_anchors(self):
+        # Sessions append to the history from timer and worker threads
+        with self.server.sessions.lock:
+            history = list(self.history.get(self.beacon_key(), ()))
+        if not history:
+            return None
+        counts = collections.Counter()
+        for keys in history:
+            counts.update(keys)
+        return { key for (key,count) in counts.items() if 2*count >= len(history) }
+
+    def update_history(self, keys):
+        key = self.beacon_key()
+        with self.server.sessions.lock:
+            if key not in self.history:
+                self.history[key] = collections.deque(maxlen=config.ranging.history)
+            self.history[key].append(frozenset(keys))
+
     def update_beacon(self, beacon):
+        # Anchor registrations are sent in the background
         if self.beacon != beacon:
-            if self.beacon:
-                self.beacon.unregister_tag(self)
             self.beacon = beacon
-            if self.beacon:
-                self.beacon.register_tag(self)
+            self.server.beacons.assign(self, beacon)
 
@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import math
+import itertools
 import numpy as np
 import numpy.linalg as lin
 
@@ -30,17 +31,80 @@ def woodoo(T):
     DoF = (ToF / DW1000_CLOCK_HZ) * Cabs
     return DoF
 
-def hypercone(b0,bi,di):
+def woodoo_array(T):
+    T = np.broadcast_arrays(*[ np.asarray(t, dtype=np.int64) for t in T ])
+    T41 = (T[3] - T[0]).astype(float)
+    T32 = (T[2] - T[1]).astype(float)
+    T54 = (T[4] - T[3]).astype(float)
+    T63 = (T[5] - T[2]).astype(float)
+    T51 = (T[4] - T[0]).astype(float)
+    T62 = (T[5] - T[1]).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ToF = (T41*T63 - T32*T54) / (T51+T62)
+    DoF = (ToF / DW1000_CLOCK_HZ) * Cabs
+    return np.where(np.isfinite(DoF), DoF, np.nan)
+
+def hypercone(b0,bi,di,ci=0):
     dim = len(b0)
     bi0 = bi - b0
     di0 = di.reshape(-1,1)
     Gb = np.block([bi0,di0])
-    hb = (_sqrsum(bi)-_sqrsum(b0)-di*di)/2
+    hb = (_sqrsum(bi)-_sqrsum(b0)-di*di+ci)/2
     Gbb = dot(Gb.T,Gb)
     Gbh = dot(Gb.T,hb)
     X = lin.solve(Gbb,Gbh)
     return X[0:dim]
 
+## Fix quality
+##
+## The solvers factor their weighted normal matrix A = LL' once per step
+## and solve with the factor. At convergence the same factor gives the
+## quality: the position block of A^-1 = L'^-1 L^-1 is the covariance of
+## the fix, so GDOP is its trace relative to the range sigma, read from
+## the columns of L^-1. cond_est = (max diag L / min diag L)^2 is only a
+## cheap lower bound of the condition number, hence the name.
+
+def _forward(L,b):
+    y = np.empty(np.shape(b))
+    for i in range(len(L)):
+        y[i] = (b[i] - dot(L[i,:i],y[:i])) / L[i,i]
+    return y
+
+def _backward(L,y):
+    x = np.empty(np.shape(y))
+    for i in reversed(range(len(L))):
+        x[i] = (y[i] - dot(L[i+1:,i],x[i+1:])) / L[i,i]
+    return x
+
+def _chol_solve(L,b):
+    return _backward(L,_forward(L,b))
+
+def _cond_est(L):
+    d = np.diag(L)
+    return (np.amax(d) / np.amin(d))**2
+
+def _gdop_est(L,axes,sigma):
+    Li = _forward(L,np.eye(len(L)))
+    return math.sqrt(np.sum(Li[:,0:axes]**2)) / sigma
+
+def _sigma_ref(S):
+    return math.sqrt(np.mean(S*S))
+
+def tdoa_error(b0,bi,di,x):
+    return _norm(x - bi) - _norm(x - b0) - di
+
+def fix_quality(b0,bi,di,s,x,L,info,axes):
+    F = tdoa_error(b0,bi,di,x)
+    info['gdop'] = _gdop_est(L,axes,_sigma_ref(s))
+    info['rms'] = math.sqrt(np.mean(F*F))
+    return info
+
+def with_info(solver,*args,**kwargs):
+    info = {}
+    X,C = solver(*args,info=info,**kwargs)
+    return X,C,info
+
+
 def hyperjump2D(b0,bs,bi,di,sigma,theta):
     bi0 = bi - b0
     bs0 = bs - b0
@@ -56,11 +120,11 @@ def hyperjump2D(b0,bs,bi,di,sigma,theta):
     Gs = np.diag(Ps*Ps)
     Gbb = dot(dot(Gb.T,Gs),Gb)
     Gbh = dot(dot(Gb.T,Gs),hb)
-    X = lin.solve(Gbb,Gbh)
-    C = lin.cond(Gbb)
-    return X[0:2],C
+    L = lin.cholesky(Gbb)
+    X = _chol_solve(L,Gbh)
+    return X[0:2],L
 
-def hyperlater2D(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8):
+def hyperlater2D(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8,info=None):
     if len(ref_coord) != 2:
         raise ValueError('hyperlater2D only accepts 2D coordinsates')
     if len(coords) < 3:
@@ -70,14 +134,18 @@ def hyperlater2D(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8
     R = np.array(ranges)
     S = np.array(sigmas)
     X = hypercone(B0,B,R)
-    Y,C = hyperjump2D(B0,X,B,R,S,theta)
+    Y,G = hyperjump2D(B0,X,B,R,S,theta)
     if delta is None:
         delta = np.amin(S) / 2
     N = 1
     while N < maxiter and _dist(X,Y) > delta:
         X = Y
         N = N + 1
-        Y,C = hyperjump2D(B0,X,B,R,S,theta)
+        Y,G = hyperjump2D(B0,X,B,R,S,theta)
+    C = _cond_est(G)
+    if info is not None:
+        info['iter'] = N
+        fix_quality(B0,B,R,S,Y,G,info,2)
     X = np.array((Y[0],Y[1],0))
     return X,C
 
@@ -97,11 +165,11 @@ def hyperjump3D(b0,bs,bi,di,sigma,theta):
     Gs = np.diag(Ps*Ps)
     Gbb = dot(dot(Gb.T,Gs),Gb)
     Gbh = dot(dot(Gb.T,Gs),hb)
-    X = lin.solve(Gbb,Gbh)
-    C = lin.cond(Gbb)
-    return X[0:3],C
+    L = lin.cholesky(Gbb)
+    X = _chol_solve(L,Gbh)
+    return X[0:3],L
 
-def hyperlater3D(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8):
+def hyperlater3D(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8,info=None):
     if len(ref_coord) != 3:
         raise ValueError('hyperlater3D only accepts 3D coordinsates')
     if len(coords) < 4:
@@ -111,14 +179,18 @@ def hyperlater3D(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8
     R = np.array(ranges)
     S = np.array(sigmas)
     X = hypercone(B0,B,R)
-    Y,C = hyperjump3D(B0,X,B,R,S,theta)
+    Y,G = hyperjump3D(B0,X,B,R,S,theta)
     if delta is None:
         delta = np.amin(S) / 2
     N = 1
     while N < maxiter and _dist(X,Y) > delta:
         X = Y
         N = N + 1
-        Y,C = hyperjump3D(B0,X,B,R,S,theta)
+        Y,G = hyperjump3D(B0,X,B,R,S,theta)
+    C = _cond_est(G)
+    if info is not None:
+        info['iter'] = N
+        fix_quality(B0,B,R,S,Y,G,info,3)
     return Y,C
 
 
@@ -142,7 +214,8 @@ def hyperjump3Dp(b0,bs,bi,di,sigma,theta):
     dis = _norm(bi - bs)
     di0 = di.reshape(-1,1)
     Gb = np.block([[bi0_xy,di0],[bs0_xy,-ds0],[bs[1],-bs[0],0]])
-    hb = np.block([(_sqrsum(bi_xy)-_sqrsum(b0_xy)-di*di+ci0_z)/2, dot(bs0_xy.T,b0_xy), 0])
+    # The cone constraint keeps the known height offset to the reference
+    hb = np.block([(_sqrsum(bi_xy)-_sqrsum(b0_xy)-di*di+ci0_z)/2, dot(bs0_xy.T,b0_xy)-bs0[2]*bs0[2], 0])
     Cv = ds0*theta
     Cc = ds0*theta*theta/2
     Pm = dis*sigma
@@ -150,13 +223,13 @@ def hyperjump3Dp(b0,bs,bi,di,sigma,theta):
     Gs = np.diag(Ps*Ps)
     Gbb = dot(dot(Gb.T,Gs),Gb)
     Gbh = dot(dot(Gb.T,Gs),hb)
-    X = lin.solve(Gbb,Gbh)
-    C = lin.cond(Gbb)
+    L = lin.cholesky(Gbb)
+    X = _chol_solve(L,Gbh)
     R = np.array((X[0],X[1],bs[2]))
-    return R,C
+    return R,L
 
 
-def hyperlater3Dp(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8,z_est=0.0):
+def hyperlater3Dp(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=8,z_est=0.0,info=None):
     if len(ref_coord) != 3:
         raise ValueError('hyperlater_pseudo3D only accepts 3D coordinsates')
     if len(coords) < 4:
@@ -165,15 +238,335 @@ def hyperlater3Dp(ref_coord,coords,ranges,sigmas,delta=None,theta=0.045,maxiter=
     B = np.array(coords)
     R = np.array(ranges)
     S = np.array(sigmas)
-    X = hypercone(B0[0:2],B[:,0:2],R)
+    Z = (B[:,2] - B0[2]) * ((B[:,2] - z_est) + (B0[2] - z_est))
+    X = hypercone(B0[0:2],B[:,0:2],R,Z)
     X = np.array((X[0],X[1],z_est))
-    Y,C = hyperjump3Dp(B0,X,B,R,S,theta)
+    Y,G = hyperjump3Dp(B0,X,B,R,S,theta)
     if delta is None:
         delta = np.amin(S) / 2
     N = 1
     while N < maxiter and _dist(X,Y) > delta:
         X = Y
         N = N + 1
-        Y,C = hyperjump3Dp(B0,X,B,R,S,theta)
+        Y,G = hyperjump3Dp(B0,X,B,R,S,theta)
+    C = _cond_est(G)
+    if info is not None:
+        info['iter'] = N
+        fix_quality(B0,B,R,S,Y,G,info,2)
     return Y,C
 
+
+
+
+## Warm started Levenberg-Marquardt solver
+##
+## Iterates on the TDoA residuals |X-Bi| - |X-B0| - Ri starting from a
+## previous position. If the start is missing or its residual RMS is
+## above max_residual, it falls back to the hypercone estimate. The
+## iteration count is the number of linear solves over the anchors, so
+## a cold start pays one for the hypercone and a warm start does not.
+
+def tdoa_residual(b0,bi,di,x):
+    vi = x - bi
+    v0 = x - b0
+    ni = np.maximum(_norm(vi), 1e-9)
+    n0 = max(_norm(v0), 1e-9)
+    F = ni - n0 - di
+    J = vi / ni.reshape(-1,1) - v0 / n0
+    return F,J
+
+def gausslater(ref_coord,coords,ranges,sigmas,start=None,delta=None,maxiter=8,lmbda=1e-3,max_residual=None):
+    B0 = np.array(ref_coord, dtype=float)
+    B = np.array(coords, dtype=float)
+    R = np.array(ranges, dtype=float)
+    S = np.array(sigmas, dtype=float)
+    dim = len(B0)
+    if len(B) < dim + 1:
+        raise np.linalg.LinAlgError('Not enough inputs: {}'.format(len(B)))
+    W = 1 / (S*S)
+    if delta is None:
+        delta = np.amin(S) / 2
+    warm = False
+    if start is not None:
+        X = np.array(start[0:dim], dtype=float)
+        F,J = tdoa_residual(B0,B,R,X)
+        warm = max_residual is None or math.sqrt(np.mean(F*F)) < max_residual
+    if not warm:
+        X = hypercone(B0,B,R)
+        F,J = tdoa_residual(B0,B,R,X)
+    cost = dot(W*F,F)
+    N = 0 if warm else 1
+    while N < maxiter:
+        N = N + 1
+        A = dot(J.T*W,J)
+        g = dot(J.T*W,F)
+        step = _chol_solve(lin.cholesky(A + lmbda*np.diag(np.diag(A))), -g)
+        Fn,Jn = tdoa_residual(B0,B,R,X+step)
+        costn = dot(W*Fn,Fn)
+        if costn < cost:
+            X = X + step
+            F,J,cost = Fn,Jn,costn
+            lmbda = lmbda / 10
+        else:
+            lmbda = lmbda * 10
+        if _norm(step) < delta:
+            break
+    L = lin.cholesky(dot(J.T*W,J))
+    info = { 'iter': N, 'warm': warm, 'rms': math.sqrt(np.mean(F*F)), 'gdop': _gdop_est(L,dim,_sigma_ref(S)) }
+    return X,_cond_est(L),info
+
+def gausslater2D(ref_coord,coords,ranges,sigmas,**kwargs):
+    if len(ref_coord) != 2:
+        raise ValueError('gausslater2D only accepts 2D coordinates')
+    X,C,info = gausslater(ref_coord,coords,ranges,sigmas,**kwargs)
+    return np.array((X[0],X[1],0)),C,info
+
+def gausslater3D(ref_coord,coords,ranges,sigmas,**kwargs):
+    if len(ref_coord) != 3:
+        raise ValueError('gausslater3D only accepts 3D coordinates')
+    return gausslater(ref_coord,coords,ranges,sigmas,**kwargs)
+
+
+## Batched solvers
+##
+## K problems of up to N anchors are padded into (K,N,...) arrays with
+## a (K,N) boolean mask. Problems with too few anchors or a singular
+## system are returned as NaN.
+
+def pad_batch(problems, dim):
+    K = len(problems)
+    N = max([ len(prob[1]) for prob in problems ] + [ 1 ])
+    B0 = np.zeros((K,dim))
+    B = np.zeros((K,N,dim))
+    R = np.zeros((K,N))
+    S = np.ones((K,N))
+    M = np.zeros((K,N), dtype=bool)
+    for (k,(ref,coords,ranges,sigmas)) in enumerate(problems):
+        n = len(coords)
+        B0[k] = np.asarray(ref)[0:dim]
+        if n > 0:
+            B[k,:n] = np.asarray(coords)[:,0:dim]
+            R[k,:n] = ranges
+            S[k,:n] = sigmas
+            M[k,:n] = True
+    return B0,B,R,S,M
+
+def _sqrsum_batch(a):
+    return np.sum(a*a,-1)
+
+def _solve_batch(A,b):
+    try:
+        return lin.solve(A,b[...,None])[...,0]
+    except lin.LinAlgError:
+        X = np.full(b.shape, np.nan)
+        for k in range(len(A)):
+            try:
+                X[k] = lin.solve(A[k],b[k])
+            except lin.LinAlgError:
+                pass
+        return X
+
+def _chol_batch(A):
+    L = np.full(A.shape, np.nan)
+    ok = np.all(np.isfinite(A),(1,2))
+    try:
+        L[ok] = lin.cholesky(A[ok])
+    except lin.LinAlgError:
+        for k in np.flatnonzero(ok):
+            try:
+                L[k] = lin.cholesky(A[k])
+            except lin.LinAlgError:
+                pass
+    ok = np.all(np.isfinite(L),(1,2))
+    return L,ok
+
+def _forward_batch(L,b):
+    y = np.empty(b.shape)
+    for i in range(L.shape[1]):
+        y[:,i] = (b[:,i] - np.einsum('kj,kjm->km',L[:,i,:i],y[:,:i])) / L[:,i,i,None]
+    return y
+
+def _backward_batch(L,y):
+    x = np.empty(y.shape)
+    for i in reversed(range(L.shape[1])):
+        x[:,i] = (y[:,i] - np.einsum('kj,kj->k',L[:,i+1:,i],x[:,i+1:])) / L[:,i,i]
+    return x
+
+def _chol_solve_batch(L,b):
+    return _backward_batch(L,_forward_batch(L,b[...,None])[...,0])
+
+def _finite(a):
+    return np.where(np.isfinite(a),a,np.inf)
+
+def _cond_est_batch(L):
+    d = np.diagonal(L,0,1,2)
+    return _finite((np.amax(d,1) / np.amin(d,1))**2)
+
+def _gdop_est_batch(L,axes,sigma):
+    Li = _forward_batch(L,np.broadcast_to(np.eye(L.shape[1]),L.shape))
+    return _finite(np.sqrt(np.sum(Li[:,:,0:axes]**2,(1,2))) / sigma)
+
+def fix_quality_batch(b0,bi,di,s,m,x,L):
+    ni = np.sqrt(_sqrsum_batch(x[:,None,:] - bi))
+    n0 = np.sqrt(_sqrsum_batch(x - b0))
+    F = (ni - n0[:,None] - di) * m
+    n = np.maximum(np.sum(m,1),1)
+    G = _gdop_est_batch(L,b0.shape[1],np.sqrt(np.sum(s*s*m,1) / n))
+    R = np.sqrt(np.sum(F*F,1) / n)
+    return G,R
+
+def hypercone_batch(b0,bi,di,m):
+    dim = b0.shape[1]
+    bi0 = bi - b0[:,None,:]
+    Gb = np.concatenate((bi0,di[...,None]),2) * m[...,None]
+    hb = (_sqrsum_batch(bi) - _sqrsum_batch(b0)[:,None] - di*di) / 2 * m
+    Gbb = np.einsum('kni,knj->kij',Gb,Gb)
+    Gbh = np.einsum('kni,kn->ki',Gb,hb)
+    X = _solve_batch(Gbb,Gbh)
+    return X[:,0:dim]
+
+def hyperjump_batch(b0,bs,bi,di,sigma,m,theta):
+    (K,dim) = b0.shape
+    bi0 = bi - b0[:,None,:]
+    bs0 = bs - b0
+    ds0 = np.sqrt(_sqrsum_batch(bs0))
+    dis = np.sqrt(_sqrsum_batch(bi - bs[:,None,:]))
+    Gr = np.zeros((K,dim,dim+1))
+    Gr[:,0,0:dim] = bs0
+    Gr[:,0,dim] = -ds0
+    for j in range(1,dim):
+        Gr[:,j,0] = bs[:,j]
+        Gr[:,j,j] = -bs[:,0]
+    Gb = np.concatenate((np.concatenate((bi0,di[...,None]),2),Gr),1)
+    hr = np.zeros((K,dim))
+    hr[:,0] = np.sum(bs0*b0,1)
+    hb = np.concatenate(((_sqrsum_batch(bi) - _sqrsum_batch(b0)[:,None] - di*di) / 2, hr),1)
+    Cv = ds0*theta
+    Cc = ds0*theta*theta/2
+    Pm = dis*sigma
+    Pr = np.empty((K,dim))
+    Pr[:,0] = 1/Cc
+    Pr[:,1:] = (1/Cv)[:,None]
+    Ps = np.concatenate((np.divide(1.0,Pm,out=np.zeros_like(Pm),where=m),Pr),1)
+    W = Ps*Ps
+    Gbb = np.einsum('kni,kn,knj->kij',Gb,W,Gb)
+    Gbh = np.einsum('kni,kn,kn->ki',Gb,W,hb)
+    L = _chol_batch(Gbb)[0]
+    X = _chol_solve_batch(L,Gbh)
+    return X[:,0:dim],L
+
+def hyperlater_batch(B0,B,R,S,M,delta=None,theta=0.045,maxiter=8,info=None):
+    (K,dim) = B0.shape
+    X = np.full((K,dim), np.nan)
+    C = np.full(K, np.inf)
+    if info is not None:
+        info['iter'] = np.zeros(K, dtype=int)
+        info['gdop'] = np.full(K, np.inf)
+        info['rms'] = np.full(K, np.nan)
+    valid = np.flatnonzero(np.sum(M,1) > dim)
+    if len(valid) == 0:
+        return X,C
+    (B0,B,R,S,M) = (B0[valid],B[valid],R[valid],S[valid],M[valid])
+    if delta is None:
+        delta = np.amin(np.where(M,S,np.inf),1) / 2
+    else:
+        delta = np.full(len(valid), delta)
+    Xk = hypercone_batch(B0,B,R,M)
+    Yk,Gk = hyperjump_batch(B0,Xk,B,R,S,M,theta)
+    N = 1
+    Nk = np.ones(len(valid), dtype=int)
+    active = np.flatnonzero(_norm(Xk-Yk) > delta)
+    while N < maxiter and len(active) > 0:
+        Xk[active] = Yk[active]
+        N = N + 1
+        a = active
+        Nk[a] = N
+        Yk[a],Gk[a] = hyperjump_batch(B0[a],Xk[a],B[a],R[a],S[a],M[a],theta)
+        active = a[_norm(Xk[a]-Yk[a]) > delta[a]]
+    X[valid] = Yk
+    C[valid] = _cond_est_batch(Gk)
+    if info is not None:
+        info['iter'][valid] = Nk
+        (info['gdop'][valid],info['rms'][valid]) = fix_quality_batch(B0,B,R,S,M,Yk,Gk)
+    return X,C
+
+def batch_info(info,K):
+    return [ { 'iter': int(info['iter'][k]), 'gdop': float(info['gdop'][k]), 'rms': float(info['rms'][k]) }
+             for k in range(K) ]
+
+def hyperlater2D_batch(problems,delta=None,theta=0.045,maxiter=8,info=None):
+    (B0,B,R,S,M) = pad_batch(problems,2)
+    Q = {} if info is not None else None
+    (X,C) = hyperlater_batch(B0,B,R,S,M,delta,theta,maxiter,Q)
+    X = np.concatenate((X,np.zeros((len(X),1))),1)
+    if info is not None:
+        info.extend(batch_info(Q,len(X)))
+    return X,C
+
+def hyperlater3D_batch(problems,delta=None,theta=0.045,maxiter=8,info=None):
+    (B0,B,R,S,M) = pad_batch(problems,3)
+    Q = {} if info is not None else None
+    (X,C) = hyperlater_batch(B0,B,R,S,M,delta,theta,maxiter,Q)
+    if info is not None:
+        info.extend(batch_info(Q,len(X)))
+    return X,C
+
+
+## RANSAC solver
+##
+## Minimal anchor subsets are solved in one batch, at most max_subsets
+## of them. The hypothesis with the largest consensus, by TDoA residual
+## below threshold, is re-solved on its inliers. Indices of the rejected
+## anchors are returned in info.
+
+def ransac_subsets(n, size, count):
+    if math.comb(n,size) <= count:
+        subsets = list(itertools.combinations(range(n),size))
+        M = np.zeros((len(subsets),n), dtype=bool)
+        for (k,subset) in enumerate(subsets):
+            M[k,subset] = True
+    else:
+        index = np.argsort(np.random.default_rng().random((count,n)),1)[:,0:size]
+        M = np.zeros((count,n), dtype=bool)
+        np.put_along_axis(M,index,True,1)
+    return M
+
+def hyperransac(ref_coord,coords,ranges,sigmas,solver,threshold=0.3,max_subsets=64,delta=None,theta=0.045,maxiter=8):
+    B0 = np.array(ref_coord, dtype=float)
+    B = np.array(coords, dtype=float)
+    R = np.array(ranges, dtype=float)
+    S = np.array(sigmas, dtype=float)
+    (N,dim) = B.shape
+    size = dim + 1
+    inliers = np.ones(N, dtype=bool)
+    K = 0
+    if N > size + 1:
+        M = ransac_subsets(N,size,max_subsets)
+        K = len(M)
+        (X,C) = hyperlater_batch(np.broadcast_to(B0,(K,dim)), np.broadcast_to(B,(K,N,dim)),
+                                 np.broadcast_to(R,(K,N)), np.broadcast_to(S,(K,N)), M,
+                                 delta, theta, maxiter)
+        with np.errstate(invalid='ignore'):
+            F = np.abs(np.sqrt(_sqrsum_batch(X[:,None,:] - B)) - np.sqrt(_sqrsum_batch(X - B0))[:,None] - R)
+            I = F < threshold
+        count = np.sum(I,1)
+        cost = np.sum(np.where(I,F*F,0),1)
+        best = np.lexsort((cost,-count))[0]
+        # Without a consensus beyond the subset itself all anchors are kept
+        if count[best] > size:
+            inliers = I[best]
+    info = {}
+    X,C = solver(B0,B[inliers],R[inliers],S[inliers],delta=delta,theta=theta,maxiter=maxiter,info=info)
+    info['subsets'] = K
+    info['rejected'] = np.flatnonzero(~inliers).tolist()
+    return X,C,info
+
+def hyperransac2D(ref_coord,coords,ranges,sigmas,**kwargs):
+    if len(ref_coord) != 2:
+        raise ValueError('hyperransac2D only accepts 2D coordinates')
+    return hyperransac(ref_coord,coords,ranges,sigmas,hyperlater2D,**kwargs)
+
+def hyperransac3D(ref_coord,coords,ranges,sigmas,**kwargs):
+    if len(ref_coord) != 3:
+        raise ValueError('hyperransac3D only accepts 3D coordinates')
+    return hyperransac(ref_coord,coords,ranges,sigmas,hyperlater3D,**kwargs)
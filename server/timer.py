@@ -2,6 +2,8 @@
 
 import os
 import time
+import heapq
+import bisect
 import threading
 
 from logger import *
@@ -12,6 +14,14 @@ _TIMER_MIN_WAIT    = 10e-6
 _TIMER_EMPTY_WAIT  = 0.1
 
 
+# Timer expiry times are on the monotonic clock
+clock = time.monotonic
+
+# Histogram bins for timer lateness (s) and expiry batch sizes
+_LATE_BINS  = ( 0.0, 100e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 50e-3 )
+_BATCH_BINS = ( 1, 2, 4, 8, 16, 32, 64, 128, 256 )
+
+
 log = getLogger(__name__)
 
 
@@ -44,7 +54,7 @@ class Timer():
                 if rearm and self.expiry is not None:
                     when = self.expiry + delay
                 else:
-                    when = time.time() + delay
+                    when = clock() + delay
             self.armed   = True
             self.expired = False
             self.expiry  = when
@@ -67,57 +77,134 @@ class PeriodicTimer(Timer):
             self.arm(rearm=True)
 
 
+class TimerStats():
+
+    def __init__(self):
+        self.wakeups   = 0
+        self.expired   = 0
+        self.late_sum  = 0.0
+        self.late_max  = 0.0
+        self.early     = 0
+        self.early_sum = 0.0
+        self.early_max = 0.0
+        self.late      = [ 0 ] * (len(_LATE_BINS) + 1)
+        self.batches   = [ 0 ] * len(_BATCH_BINS)
+
+    def record(self, lates):
+        self.wakeups += 1
+        self.expired += len(lates)
+        self.batches[bisect.bisect_right(_BATCH_BINS, len(lates)) - 1] += 1
+        for late in lates:
+            # Coalesced timers may expire early, kept apart from lateness
+            if late < 0:
+                self.early += 1
+                self.early_sum -= late
+                self.early_max = max(self.early_max, -late)
+            else:
+                self.late_sum += late
+                self.late_max = max(self.late_max, late)
+            self.late[bisect.bisect_right(_LATE_BINS, late)] += 1
+
+    def get_stats(self):
+        return {
+            'wakeups':   self.wakeups,
+            'expired':   self.expired,
+            'late_avg':  self.late_sum / max(self.expired - self.early, 1),
+            'late_max':  self.late_max,
+            'early_avg': self.early_sum / max(self.early, 1),
+            'early_max': self.early_max,
+            # Early expiries from coalescing go in the first bin
+            'late':      dict(zip([ 'early' ] + [ f'<{b*1e3:g}ms' for b in _LATE_BINS[1:] ] + [ f'>{_LATE_BINS[-1]*1e3:g}ms' ], self.late)),
+            'batches':   dict(zip([ f'>={b}' for b in _BATCH_BINS ], self.batches)),
+        }
+
+
 class TimerThread(threading.Thread):
     
-    def __init__(self):
+    def __init__(self, tolerance=0.0):
         threading.Thread.__init__(self)
         self.running = False
+        self.tolerance = tolerance
         self.lock = threading.Condition()
-        self.next = None
-        self.list = []
+        self.heap = []
+        self.entries = {}
+        self.count = 0
+        self.stats = TimerStats()
         self.start()
 
     def Timer(self, delay, func, **args):
         return Timer(self,delay,func,**args)
 
-    def update_next(self):
-        if self.list:
-            self.next = min(self.list,key=lambda tm: tm.expiry)
-        else:
-            self.next = None
-    
     def arm(self,timer):
         self.lock.acquire()
-        self.list.append(timer)
-        self.update_next()
-        self.lock.notify_all()
+        self.count += 1
+        entry = [ timer.expiry, self.count, timer ]
+        self.entries[timer] = entry
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.lock.notify_all()
         self.lock.release()
 
     def unarm(self,timer):
+        # Cancelled entries stay in the heap until they reach the top
         self.lock.acquire()
-        if timer in self.list:
-            self.list.remove(timer)
-            self.update_next()
-            self.lock.notify_all()
+        entry = self.entries.pop(timer, None)
+        if entry is not None:
+            entry[2] = None
+            if len(self.heap) > 2*len(self.entries) + 64:
+                self.heap = [ entry for entry in self.heap if entry[2] is not None ]
+                heapq.heapify(self.heap)
         self.lock.release()
 
+    def peek(self):
+        while self.heap and self.heap[0][2] is None:
+            heapq.heappop(self.heap)
+        if self.heap:
+            return self.heap[0]
+        return None
+
     def wait(self,timer):
         self.lock.acquire()
         while self.running and timer.armed and not timer.expired:
             self.lock.wait()
         self.lock.release()
 
+    def collect(self, until):
+        # Everything due within the tolerance goes out in the same wakeup
+        batch = []
+        entry = self.peek()
+        until = max(until, entry[0])
+        while entry and entry[0] <= until:
+            heapq.heappop(self.heap)
+            del self.entries[entry[2]]
+            batch.append(entry[2])
+            entry = self.peek()
+        return batch
+
+    def dispatch(self, batch):
+        lates = []
+        for timed in batch:
+            lates.append(clock() - timed.expiry)
+            timed.expire()
+        return lates
+
     def run(self):
         self.lock.acquire()
         self.running = True
         while self.running:
-            if self.next:
-                timed = self.next
-                sleep = timed.expiry - time.time()
+            entry = self.peek()
+            if entry:
+                now = clock()
+                sleep = entry[0] - now
                 if sleep < _TIMER_MIN_WAIT:
-                    self.list.remove(timed)
-                    self.update_next()
-                    timed.expire()
+                    batch = self.collect(now + self.tolerance)
+                    # Callbacks may arm and unarm timers, so run them unlocked
+                    self.lock.release()
+                    try:
+                        lates = self.dispatch(batch)
+                    finally:
+                        self.lock.acquire()
+                    self.stats.record(lates)
                     self.lock.notify_all()
                 else:
                     if sleep > _TIMER_EXP_WAIT:
@@ -134,3 +221,54 @@ class TimerThread(threading.Thread):
         self.lock.notify_all()
         self.lock.release()
 
+    def get_stats(self):
+        self.lock.acquire()
+        stats = self.stats.get_stats()
+        stats['armed'] = len(self.entries)
+        stats['tolerance'] = self.tolerance
+        self.lock.release()
+        return stats
+
+
+class AsyncTimerLoop():
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.handles = {}
+
+    def Timer(self, delay, func, **args):
+        return Timer(self,delay,func,**args)
+
+    def schedule(self,timer):
+        self.cancel(timer)
+        if timer.armed:
+            when = self.loop.time() + (timer.expiry - clock())
+            self.handles[timer] = self.loop.call_at(when, self.expire, timer)
+
+    def cancel(self,timer):
+        handle = self.handles.pop(timer, None)
+        if handle:
+            handle.cancel()
+
+    def expire(self,timer):
+        self.handles.pop(timer, None)
+        timer.expire()
+
+    def arm(self,timer):
+        self.loop.call_soon_threadsafe(self.schedule, timer)
+
+    def unarm(self,timer):
+        self.loop.call_soon_threadsafe(self.cancel, timer)
+
+    def cancel_all(self):
+        for handle in self.handles.values():
+            handle.cancel()
+        self.handles.clear()
+
+    def stop(self):
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.cancel_all)
+
+    def get_stats(self):
+        return { 'armed': len(self.handles) }
+
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+import time
+import logger
+import threading
+
+import numpy as np
+import numpy.linalg as lin
+
+from config import *
+
+
+log = logger.getLogger(__name__)
+
+
+## Constant velocity Kalman tracker
+##
+## The state [x y z vx vy vz] and covariance of every tag live in
+## contiguous (T,6) and (T,6,6) arrays, so that predict and update
+## steps run over any set of tags at once.
+
+class Tracker():
+
+    def __init__(self, capacity=64):
+        self.accel   = config.coord.track_accel
+        self.noise   = config.coord.track_noise
+        self.gate    = config.coord.track_gate
+        self.resets  = config.coord.track_resets
+        self.timeout = config.coord.track_timeout
+        self.lock    = threading.Lock()
+        self.slots   = {}
+        self.X       = np.zeros((capacity,6))
+        self.P       = np.zeros((capacity,6,6))
+        self.T       = np.zeros(capacity)
+        self.misses  = np.zeros(capacity, dtype=int)
+        self.active  = np.zeros(capacity, dtype=bool)
+        self.stats   = { 'updates':0, 'gated':0, 'resets':0 }
+
+    def get_slot(self, key):
+        if key not in self.slots:
+            slot = len(self.slots)
+            if slot == len(self.X):
+                self.X = np.concatenate((self.X, np.zeros_like(self.X)))
+                self.P = np.concatenate((self.P, np.zeros_like(self.P)))
+                self.T = np.concatenate((self.T, np.zeros_like(self.T)))
+                self.misses = np.concatenate((self.misses, np.zeros_like(self.misses)))
+                self.active = np.concatenate((self.active, np.zeros_like(self.active)))
+            self.slots[key] = slot
+        return self.slots[key]
+
+    def predict_slots(self, index, now):
+        K = len(index)
+        dt = np.maximum(now - self.T[index], 0.0)
+        F = np.tile(np.eye(6), (K,1,1))
+        F[:,0:3,3:6] = dt[:,None,None] * np.eye(3)
+        Q = np.zeros((K,6,6))
+        Q[:,0:3,0:3] = (dt**3/3)[:,None,None] * np.eye(3)
+        Q[:,0:3,3:6] = (dt**2/2)[:,None,None] * np.eye(3)
+        Q[:,3:6,0:3] = Q[:,0:3,3:6]
+        Q[:,3:6,3:6] = dt[:,None,None] * np.eye(3)
+        X = np.einsum('kij,kj->ki', F, self.X[index])
+        P = F @ self.P[index] @ F.transpose(0,2,1) + self.accel * Q
+        return X,P
+
+    def init_slots(self, index, Z, R, now):
+        self.X[index,0:3] = Z
+        self.X[index,3:6] = 0.0
+        self.P[index] = 0.0
+        self.P[index,0:3,0:3] = R[:,None,None] * np.eye(3)
+        self.P[index,3:6,3:6] = self.accel * np.eye(3)
+        self.T[index] = now
+        self.misses[index] = 0
+        self.active[index] = True
+
+    def update_batch(self, keys, coords, noises=None, now=None):
+        # Keys must be unique within one batch
+        if now is None:
+            now = time.time()
+        Z = np.array(coords, dtype=float).reshape(-1,3)
+        if noises is None:
+            noises = np.full(len(Z), self.noise)
+        R = np.maximum(np.asarray(noises, dtype=float), self.noise)**2
+        with self.lock:
+            index = np.array([ self.get_slot(key) for key in keys ], dtype=int)
+            fresh = ~self.active[index] | (now - self.T[index] > self.timeout)
+            (X,P) = self.predict_slots(index, now)
+            Y = Z - X[:,0:3]
+            S = P[:,0:3,0:3] + R[:,None,None] * np.eye(3)
+            Si = lin.inv(S)
+            D = np.einsum('ki,kij,kj->k', Y, Si, Y)
+            accept = ~fresh & (D <= self.gate)
+            G = P[:,:,0:3] @ Si
+            X = X + np.einsum('kij,kj->ki', G, Y)
+            P = P - G @ P[:,0:3,:]
+            good = index[accept]
+            self.X[good] = X[accept]
+            self.P[good] = P[accept]
+            self.T[good] = now
+            self.misses[good] = 0
+            # Gated fixes are dropped, until too many in a row restart the track
+            gated = ~fresh & ~accept
+            self.misses[index[gated]] += 1
+            reset = fresh | (gated & (self.misses[index] >= self.resets))
+            self.init_slots(index[reset], Z[reset], R[reset], now)
+            self.stats['updates'] += int(np.count_nonzero(accept | reset))
+            self.stats['gated'] += int(np.count_nonzero(gated & ~reset))
+            self.stats['resets'] += int(np.count_nonzero(reset & ~fresh))
+        return accept | reset
+
+    def update(self, key, coord, noise=None, now=None):
+        return bool(self.update_batch([key], [coord], None if noise is None else [noise], now)[0])
+
+    def predict_batch(self, keys, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            index = np.array([ self.slots.get(key, -1) for key in keys ], dtype=int)
+            X = np.full((len(index),6), np.nan)
+            ok = (index >= 0)
+            ok[ok] &= self.active[index[ok]]
+            if np.any(ok):
+                (X[ok],P) = self.predict_slots(index[ok], now)
+        return X
+
+    def position(self, key, now=None):
+        X = self.predict_batch([key], now)[0]
+        if np.all(np.isfinite(X)):
+            return X[0:3]
+        return None
+
+    def velocity(self, key, now=None):
+        X = self.predict_batch([key], now)[0]
+        if np.all(np.isfinite(X)):
+            return X[3:6]
+        return None
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['tracks'] = int(np.count_nonzero(self.active))
+        return stats
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+import logger
+import threading
+import collections
+
+import numpy as np
+
+from config import *
+
+
+log = logger.getLogger(__name__)
+
+
+class ArrivalStats():
+
+    def __init__(self, length):
+        self.samples = collections.deque(maxlen=length)
+        self.count = 0
+        self.cached = None
+
+    def add(self, offset):
+        self.samples.append(offset)
+        self.count += 1
+        self.cached = None
+
+    def percentile(self, pct):
+        if len(self.samples) < 2:
+            return None
+        if self.cached is None or self.cached[0] != pct:
+            self.cached = (pct, float(np.percentile(self.samples, pct)))
+        return self.cached[1]
+
+
+class TagWindow():
+
+    def __init__(self, length):
+        self.beacons   = ArrivalStats(length)
+        self.responses = ArrivalStats(length)
+        self.anchors   = collections.deque(maxlen=length)
+        self.window    = None
+        self.timeout   = None
+        self.sessions  = 0
+        self.late      = 0
+
+
+class WindowManager():
+
+    def __init__(self):
+        self.adaptive = config.ranging.adaptive_window
+        self.pct      = config.ranging.window_percentile
+        self.margin   = config.ranging.window_margin
+        self.floor    = config.ranging.window_floor
+        self.ceiling  = config.ranging.window_ceiling
+        self.length   = config.ranging.window_samples
+        self.lock     = threading.Lock()
+        self.tags     = {}
+        self.anchors  = {}
+
+    def get_tag(self, key):
+        if key not in self.tags:
+            self.tags[key] = TagWindow(self.length)
+        return self.tags[key]
+
+    def get_anchor(self, key):
+        if key not in self.anchors:
+            self.anchors[key] = ArrivalStats(self.length)
+        return self.anchors[key]
+
+    def record(self, tag, anchor, phase, offset, late=False):
+        # Late arrivals are sampled too, else the percentile never sees past the window
+        with self.lock:
+            stats = self.get_tag(tag.key)
+            if phase == 1:
+                stats.beacons.add(offset)
+            elif phase == 2:
+                stats.responses.add(offset)
+                stats.anchors.append(anchor.key)
+                self.get_anchor(anchor.key).add(offset)
+                if late:
+                    stats.late += 1
+
+    def get_windows(self, tag):
+        # Ranging window from the start of the session, and session timeout
+        window = config.ranging.ranging_timer
+        timeout = config.ranging.timeout_timer
+        with self.lock:
+            stats = self.get_tag(tag.key)
+            stats.sessions += 1
+            if self.adaptive:
+                offset = stats.responses.percentile(self.pct)
+                if offset is not None:
+                    # A slow anchor in range widens the window of its tags
+                    for key in set(stats.anchors):
+                        slow = self.anchors[key].percentile(self.pct)
+                        if slow is not None:
+                            offset = max(offset, slow)
+                    window = min(max(offset + self.margin, self.floor), self.ceiling)
+                    timeout = min(max(4*window, self.ceiling), config.ranging.timeout_timer)
+            stats.window = window
+            stats.timeout = timeout
+        return (window,timeout)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'tags': { key: { 'window':    stats.window,
+                                 'timeout':   stats.timeout,
+                                 'beacon':    stats.beacons.percentile(self.pct),
+                                 'response':  stats.responses.percentile(self.pct),
+                                 'samples':   stats.responses.count,
+                                 'sessions':  stats.sessions,
+                                 'late':      stats.late,
+                                 'late_rate': stats.late / max(stats.responses.count, 1), }
+                          for (key,stats) in self.tags.items() },
+                'anchors': { key: { 'response':  stats.percentile(self.pct),
+                                    'samples':   stats.count, }
+                             for (key,stats) in self.anchors.items() },
+            }
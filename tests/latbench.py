@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+import time
+import argparse
+
+import numpy as np
+
+from tdoa import *
+
+
+def make_problems(count, anchors, dim, noise):
+    rng = np.random.default_rng(1)
+    coords = rng.uniform((0,0,-1), (10,6,0), (anchors,3))[:,0:dim]
+    problems = []
+    for k in range(count):
+        tag = rng.uniform((1,1,-1), (9,5,0))[0:dim]
+        ref = coords[0]
+        B = coords[1:]
+        R = np.linalg.norm(B-tag,axis=1) - np.linalg.norm(ref-tag) + rng.normal(0, noise, len(B))
+        problems.append((ref, B, R, np.full(len(B), 0.1)))
+    return problems
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Tail lateration solver benchmark")
+
+    parser.add_argument('-t', '--tags', type=int, default=100)
+    parser.add_argument('-a', '--anchors', type=int, default=15)
+    parser.add_argument('-r', '--rounds', type=int, default=10)
+    parser.add_argument('-n', '--noise', type=float, default=0.05)
+    parser.add_argument('-3', '--3d', dest='three', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    if args.three:
+        (single,batch,dim) = (hyperlater3D,hyperlater3D_batch,3)
+    else:
+        (single,batch,dim) = (hyperlater2D,hyperlater2D_batch,2)
+
+    problems = make_problems(args.tags, args.anchors, dim, args.noise)
+
+    start = time.perf_counter()
+    for i in range(args.rounds):
+        X1 = [ single(*prob, delta=0.01)[0] for prob in problems ]
+    loop = (time.perf_counter() - start) / args.rounds
+
+    start = time.perf_counter()
+    for i in range(args.rounds):
+        (X2,C2) = batch(problems, delta=0.01)
+    vect = (time.perf_counter() - start) / args.rounds
+
+    diff = np.nanmax(np.abs(np.array(X1) - X2))
+
+    print(f'{args.tags} tags, {args.anchors} anchors, {dim}D')
+    print(f'  per-tag loop: {loop*1e3:8.3f} ms  {loop/args.tags*1e6:8.1f} us/tag')
+    print(f'  batched:      {vect*1e3:8.3f} ms  {vect/args.tags*1e6:8.1f} us/tag')
+    print(f'  speedup:      {loop/vect:8.1f}x  max diff {diff:.3g}')
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from tdoa import *
+
+
+def load_sessions(path, max_dist):
+    sessions = []
+    with open(path) as f:
+        for line in f:
+            data = json.loads(line)
+            if data['beacon'] not in data['anchors']:
+                continue
+            B = np.array(data['coords'])
+            T = np.array(data['times'], dtype=np.int64)
+            M = np.array(data['valid'])
+            ref = data['anchors'].index(data['beacon'])
+            L = woodoo_array((T[0], T[0,ref], T[1,ref], T[1], T[2], T[2,ref]))
+            V = np.all(M,0) & np.all(M[:,ref]) & np.isfinite(L)
+            V[ref] = False
+            D = np.linalg.norm(B - B[ref], axis=1) - 2*L
+            V &= np.abs(D) < max_dist
+            sessions.append((B[ref], B[V], D[V], None))
+    return sessions
+
+
+def make_sessions(count, anchors, noise, zdev):
+    rng = np.random.default_rng(3)
+    coords = rng.uniform((0,0,2), (10,6,3), (anchors,3))
+    sessions = []
+    for k in range(count):
+        tag = rng.uniform((1,1,0), (9,5,0)) + (0, 0, rng.normal(0, zdev))
+        ref = coords[0]
+        B = coords[1:]
+        D = np.linalg.norm(B-tag,axis=1) - np.linalg.norm(ref-tag) + rng.normal(0, noise, len(B))
+        sessions.append((ref, B, D, tag))
+    return sessions
+
+
+def run_mode(sessions, solver, dim, **kwargs):
+    errors = []
+    failed = 0
+    start = time.perf_counter()
+    for (ref,B,D,truth) in sessions:
+        try:
+            (X,C) = solver(ref[0:dim], B[:,0:dim], D, np.full(len(D), 0.1), delta=0.01, **kwargs)
+            if truth is not None:
+                errors.append(np.linalg.norm(X[0:2] - truth[0:2]))
+        except Exception:
+            failed += 1
+    elapsed = (time.perf_counter() - start) / max(len(sessions), 1)
+    return (elapsed, errors, failed)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Tail 2D / pseudo-3D / 3D lateration comparison")
+
+    parser.add_argument('-r', '--record', type=str, default=None)
+    parser.add_argument('-c', '--count', type=int, default=1000)
+    parser.add_argument('-a', '--anchors', type=int, default=8)
+    parser.add_argument('-n', '--noise', type=float, default=0.05)
+    parser.add_argument('-z', '--zdev', type=float, default=0.2)
+    parser.add_argument('-m', '--max-dist', type=float, default=100.0)
+
+    args = parser.parse_args()
+
+    if args.record:
+        sessions = load_sessions(args.record, args.max_dist)
+        print(f'{len(sessions)} recorded sessions from {args.record}')
+    else:
+        sessions = make_sessions(args.count, args.anchors, args.noise, args.zdev)
+        print(f'{len(sessions)} sessions, {args.anchors} anchors, {args.noise} m noise, tag z dev {args.zdev} m')
+
+    modes = (
+        ('2D',  hyperlater2D,  2, {}),
+        ('3Dp', hyperlater3Dp, 3, { 'z_est': 0.0 }),
+        ('3D',  hyperlater3D,  3, {}),
+    )
+
+    for (name,solver,dim,kwargs) in modes:
+        (elapsed,errors,failed) = run_mode(sessions, solver, dim, **kwargs)
+        line = f'  {name:4s} {elapsed*1e6:8.1f} us/fix  {failed:5d} failed'
+        if errors:
+            line += f'  xy error avg {np.mean(errors):.3f} m  p95 {np.percentile(errors,95):.3f} m'
+        print(line)
+
+
+if __name__ == "__main__": main()
@@ -7,13 +7,14 @@ import argparse
 import paho.mqtt.client as mqtt
 
 from wpan import *
+from rfmsg import *
 from logger import *
 from pprint import pprint
 
 
 def on_message(client, userdata, msg):
     try:
-        rfmsg = json.loads(msg.payload.decode())
+        rfmsg = decode_rf_msg(msg.payload)
         frame = TailWPANFrame(rfmsg['FRAME'],rfmsg['FINFO'])
         anchor = rfmsg['ANCHOR']
         print(f'Anchor:{anchor}\n{frame}')
@@ -21,6 +21,8 @@ def main():
     parser.add_argument('-D', '--debug', action='count', default=0)
     parser.add_argument('-L', '--logging', type=str, default=None)
     parser.add_argument('-A', '--anchor', type=str, default='70b3d5b1e0000052')
+    parser.add_argument('-F', '--func', type=str, default='GETDWSTATS')
+    parser.add_argument('--dump', action='store_true', default=False)
 
     args = parser.parse_args()
 
@@ -37,7 +39,10 @@ def main():
 
     MRPC = MQRPC(MQTT, MYUID)
 
-    data = MRPC.call(remote, 'GETDWSTATS')
+    if args.func == 'GETRPCSTATS':
+        data = MRPC.call(remote, args.func, DUMP=args.dump)
+    else:
+        data = MRPC.call(remote, args.func)
 
     for (key,val) in data.items():
         print(f'{key}: {val}')
@@ -0,0 +1 @@
+../server/tdoa.py
\ No newline at end of file
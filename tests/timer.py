@@ -0,0 +1 @@
+../server/timer.py
\ No newline at end of file
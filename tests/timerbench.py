@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+
+import time
+import random
+import argparse
+import threading
+
+from timer import *
+
+
+class ListTimerThread(TimerThread):
+
+    # The previous list based implementation, for comparison
+
+    def __init__(self, tolerance=0.0):
+        self.list = []
+        self.next = None
+        TimerThread.__init__(self)
+
+    def update_next(self):
+        if self.list:
+            self.next = min(self.list,key=lambda tm: tm.expiry)
+        else:
+            self.next = None
+
+    def arm(self,timer):
+        self.lock.acquire()
+        self.list.append(timer)
+        self.update_next()
+        self.lock.notify_all()
+        self.lock.release()
+
+    def unarm(self,timer):
+        self.lock.acquire()
+        if timer in self.list:
+            self.list.remove(timer)
+            self.update_next()
+            self.lock.notify_all()
+        self.lock.release()
+
+    def run(self):
+        self.lock.acquire()
+        self.running = True
+        while self.running:
+            if self.next:
+                timed = self.next
+                sleep = timed.expiry - clock()
+                if sleep < 10e-6:
+                    self.list.remove(timed)
+                    self.update_next()
+                    timed.expire()
+                    self.lock.notify_all()
+                else:
+                    self.lock.wait(min(sleep, 0.01))
+            else:
+                self.lock.wait(0.1)
+        self.lock.release()
+
+
+def bench_rearm(thread, count, ops):
+    timers = [ thread.Timer(random.uniform(60,120), None) for i in range(count) ]
+    start = time.perf_counter()
+    for timer in timers:
+        timer.arm()
+    fill = (time.perf_counter() - start) / count
+    sample = random.sample(timers, min(ops, count))
+    start = time.perf_counter()
+    for timer in sample:
+        timer.unarm()
+        timer.arm()
+    rearm = (time.perf_counter() - start) / len(sample)
+    for timer in timers:
+        timer.unarm()
+    return (fill,rearm)
+
+
+def bench_expire(thread, count, spread):
+    done = threading.Event()
+    late = []
+    def expired(timer):
+        late.append(clock() - timer.expiry)
+        if len(late) == count:
+            done.set()
+    # Leave enough time to arm everything before the first expiry
+    base = clock() + 0.2 + count * 10e-6
+    for i in range(count):
+        timer = thread.Timer(0, None)
+        timer.func = expired
+        timer.args = { 'timer': timer }
+        timer.arm(when=base + random.uniform(0, spread))
+    done.wait(60 + count * 1e-3)
+    late.sort()
+    if not late:
+        return (0,None,None)
+    return (len(late), late[len(late)//2], late[-1])
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Tail timer thread benchmark")
+
+    parser.add_argument('-n', '--counts', type=int, nargs='+', default=[10000,100000])
+    parser.add_argument('-o', '--ops', type=int, default=1000)
+    parser.add_argument('-s', '--spread', type=float, default=0.5)
+    parser.add_argument('-t', '--tolerance', type=float, default=0.0)
+    parser.add_argument('-b', '--baseline', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    impls = [ ('heap',TimerThread) ]
+    if args.baseline:
+        impls.append(('list',ListTimerThread))
+
+    for count in args.counts:
+        for (name,impl) in impls:
+            thread = impl(args.tolerance)
+            (fill,rearm) = bench_rearm(thread, count, args.ops)
+            (expired,median,worst) = bench_expire(thread, count, args.spread)
+            stats = thread.get_stats()
+            thread.stop()
+            print(f'{count:7d} timers {name}:  arm {fill*1e6:8.2f} us  rearm {rearm*1e6:8.2f} us  '
+                  f'expired {expired}  late p50 {median*1e3 if median is not None else 0:.3f} ms  '
+                  f'max {worst*1e3 if worst is not None else 0:.3f} ms  wakeups {stats["wakeups"]}')
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+import time
+import argparse
+
+import numpy as np
+
+from tdoa import *
+
+
+def make_track(fixes, anchors, dim, step, noise):
+    rng = np.random.default_rng(2)
+    coords = rng.uniform((0,0,-1), (10,6,0), (anchors,3))[:,0:dim]
+    tag = rng.uniform((2,2,-1), (8,4,0))[0:dim]
+    track = []
+    for k in range(fixes):
+        move = rng.normal(0, 1, dim)
+        tag = tag + step * move / np.linalg.norm(move)
+        ref = coords[0]
+        B = coords[1:]
+        R = np.linalg.norm(B-tag,axis=1) - np.linalg.norm(ref-tag) + rng.normal(0, noise, len(B))
+        track.append((ref, B, R, np.full(len(B), 0.1)))
+    return track
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Tail warm start solver benchmark")
+
+    parser.add_argument('-f', '--fixes', type=int, default=1000)
+    parser.add_argument('-a', '--anchors', type=int, default=15)
+    parser.add_argument('-s', '--step', type=float, default=0.1)
+    parser.add_argument('-n', '--noise', type=float, default=0.05)
+    parser.add_argument('-r', '--residual', type=float, default=0.3)
+    parser.add_argument('-3', '--3d', dest='three', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    if args.three:
+        (solver,dim) = (gausslater3D,3)
+    else:
+        (solver,dim) = (gausslater2D,2)
+
+    track = make_track(args.fixes, args.anchors, dim, args.step, args.noise)
+
+    # Same solver, convergence test and iteration count for both runs,
+    # only the start differs: the hypercone or the previous fix
+    iters = []
+    start = time.perf_counter()
+    for prob in track:
+        (_,C,info) = solver(*prob, delta=0.01)
+        iters.append(info['iter'])
+    cold_time = (time.perf_counter() - start) / len(track)
+    cold_iter = np.mean(iters)
+
+    iters = []
+    warms = 0
+    prev = None
+    start = time.perf_counter()
+    for prob in track:
+        (prev,C,info) = solver(*prob, start=prev, delta=0.01, max_residual=args.residual)
+        iters.append(info['iter'])
+        warms += info['warm']
+    warm_time = (time.perf_counter() - start) / len(track)
+    warm_iter = np.mean(iters)
+
+    print(f'{args.fixes} fixes, {args.anchors} anchors, {dim}D, {args.step} m per fix')
+    print(f'  cold start: {cold_iter:5.2f} iterations  {cold_time*1e6:8.1f} us/fix')
+    print(f'  warm start: {warm_iter:5.2f} iterations  {warm_time*1e6:8.1f} us/fix  ({warms} warm)')
+
+
+if __name__ == "__main__": main()